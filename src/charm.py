@@ -1,74 +1,197 @@
 #!/usr/bin/env python3
 
+import hashlib
+import json
 import logging
+import os
+import time
 import typing
+from pathlib import Path
 
+import yaml
 from charmed_kubeflow_chisme.exceptions import ErrorWithStatus
-from charmed_kubeflow_chisme.kubernetes import KubernetesResourceHandler
 from charms.data_platform_libs.v0.data_interfaces import DatabaseRequires
 from charms.observability_libs.v0.kubernetes_compute_resources_patch import (
     K8sResourcePatchFailedEvent,
-    KubernetesComputeResourcesPatch,
     ResourceRequirements,
-    adjust_resource_requirements,
 )
-from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
 from lightkube import ApiError
-from lightkube.generic_resource import load_in_cluster_generic_resources
 from lightkube.models.core_v1 import ServicePort
-from lightkube.resources.batch_v1 import Job
-from ops.charm import CharmBase
+from ops.charm import CharmBase, UpdateStatusEvent
+from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
-from ops.pebble import ChangeError, Layer
-from serialized_data_interface import NoCompatibleVersions, NoVersionsListed, get_interfaces
-from tenacity import retry, stop_after_attempt, wait_fixed
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    MaintenanceStatus,
+    ModelError,
+    WaitingStatus,
+)
+from ops.pebble import APIError, ChangeError, CheckLevel, CheckStatus, ExecError, Layer
+
+from database import first_reachable, parse_endpoints, split_endpoint
+from k8s_client import LightkubeClientProvider
+from k8s_patches import (
+    SchedulingPatch,
+    SchedulingSpec,
+    SharedClientResourcesPatch,
+    SharedClientServicePatch,
+    ShutdownPatch,
+    ShutdownSpec,
+)
+from migration import (
+    MIGRATION_FAILED,
+    MIGRATION_PENDING,
+    MIGRATION_RUNNING,
+    MIGRATION_SUCCEEDED,
+    SCHEMA_REVISION_PROBE,
+    JobStatus,
+    migration_job_name,
+    migration_key,
+    pinned_image,
+    watch_job_status,
+)
+from resources import resource_requirements
+from serving import (
+    HEALTH_PATH,
+    PoolSettings,
+    check_health_check,
+    gunicorn_command,
+    pool_settings,
+    server_ready,
+    serving_profile,
+    uvicorn_command,
+    worker_count,
+)
+
+if typing.TYPE_CHECKING:
+    from charmed_kubeflow_chisme.kubernetes import KubernetesResourceHandler
+    from lightkube.resources.core_v1 import Pod
 
+# Modules only some code paths need, such as the migration Job handling or the relation
+# interface schemas, are imported where they are used, to keep the cold start of every hook
+# short. tests/benchmark/test_import_time.py holds the import time under a budget.
+
+PEER_RELATION = "zenml-peers"
+# Peer relation keys of the rolling restart: units request a restart in their own databag and
+# the leader grants it to one unit at a time in the application databag
+RESTART_REQUEST = "restart-request"
+RESTART_GRANTED = "restart-granted"
+SDI_ENDPOINTS = ["ingress"]
+# Used for the migration Job if the pod spec cannot be read
+DEFAULT_WORKLOAD_IMAGE = "zenmldocker/zenml-server"
 ZENML_JOB = [
     "src/jobs/zenml-db-job.yaml.j2",
 ]
+ZENML_PDB = [
+    "src/policy/zenml-server-pdb.yaml.j2",
+]
+
+# Upper bound, in seconds, a single hook spends watching the migration Job
+MIGRATION_WATCH_TIMEOUT = 5
+# Finished migration Jobs and their pods are garbage-collected after an hour
+MIGRATION_JOB_TTL = 3600
+SCHEMA_REVISION_PROBE_TIMEOUT = 30
+# Environment of `zenml migrate-database`, matching the migration Job template
+MIGRATION_ENVIRONMENT = [
+    "ZENML_LOGGING_VERBOSITY",
+    "ZENML_DEFAULT_PROJECT_NAME",
+    "ZENML_DEFAULT_USER_NAME",
+    "ZENML_STORE_TYPE",
+    "ZENML_STORE_SSL_VERIFY_SERVER_CERT",
+    "ZENML_STORE_URL",
+]
+DB_ENDPOINT_PROBE_TIMEOUT = 1
+# Seconds to wait for a replanned server to start answering its health endpoint
+SERVER_READY_TIMEOUT = 30
+SERVER_READY_POLL_INTERVAL = 1
+SERVER_READY_PROBE_TIMEOUT = 2
+
+# Seconds Pebble and Kubernetes leave a stopping server, beyond its graceful shutdown timeout,
+# to exit before killing it
+SHUTDOWN_MARGIN = 5
+
+# Kubernetes API call log written to the charm directory when `k8s_api_call_log` is enabled
+K8S_API_CALL_LOG = "k8s-api-calls.json"
+K8S_API_CALL_LOG_ENTRIES = 100
 
 
 class ZenMLCharm(CharmBase):
     """A Juju Charm for ZenML Server."""
 
+    _stored = StoredState()
+
     def __init__(self, *args):
         super().__init__(*args)
 
         self.logger = logging.getLogger(__name__)
+        self._stored.set_default(
+            reconcile_fingerprint="",
+            workload_image="",
+            migration_state=MIGRATION_PENDING,
+            migration_target="",
+            migrated_schema="",
+            migration_job="",
+            migration_attempt=0,
+            db_endpoints="",
+            db_endpoint="",
+            disruption_budget=None,
+            legacy_migration_job_removed=False,
+        )
         self._port = self.model.config["zenml_port"]
         self._container_name = "zenml-server"
         self._database_name = "zenml"
         self._container = self.unit.get_container(self._container_name)
 
-        self.resources_patch = KubernetesComputeResourcesPatch(
+        self._lightkube_field_manager = "lightkube"
+        self._lightkube = LightkubeClientProvider(field_manager=self._lightkube_field_manager)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+
+        self.resources_patch = SharedClientResourcesPatch(
             self,
             self._container_name,
             resource_reqs_func=self._resource_spec_from_config,
+            client_provider=self._lightkube,
         )
         self.framework.observe(
             self.resources_patch.on.patch_failed, self._on_resource_patch_failed
         )
+        self.scheduling_patch = SchedulingPatch(
+            self,
+            spec_func=self._scheduling_spec_from_config,
+            patcher=self.resources_patch.patcher,
+        )
+        self.shutdown_patch = ShutdownPatch(
+            self,
+            self._container_name,
+            spec_func=self._shutdown_spec_from_config,
+            patcher=self.resources_patch.patcher,
+        )
+        for patch in (self.scheduling_patch, self.shutdown_patch):
+            self.framework.observe(patch.on.patch_failed, self._on_resource_patch_failed)
 
         self.database = DatabaseRequires(
             self, relation_name="relational-db", database_name=self._database_name
         )
 
-        self.framework.observe(self.on.upgrade_charm, self._on_event)
+        self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
         self.framework.observe(self.on.config_changed, self._on_event)
         self.framework.observe(self.on.zenml_server_pebble_ready, self._on_pebble_ready)
 
         for rel in self.model.relations.keys():
             self.framework.observe(self.on[rel].relation_changed, self._on_event)
 
-        self._lightkube_field_manager = "lightkube"
-        self._zenml_job_resource_handler: KubernetesResourceHandler = None
+        self._zenml_job_resource_handler: typing.Optional["KubernetesResourceHandler"] = None
+        # Set by a failed Kubernetes patch, which runs before the reconcile of the same event
+        self._patch_failure: typing.Optional[str] = None
 
         self._create_service()
 
         self.framework.observe(self.on.update_status, self._on_event)
         self.framework.observe(self.database.on.database_created, self._on_database_created)
         self.framework.observe(self.database.on.endpoints_changed, self._on_event)
+        # DatabaseRequires ignores secret-changed, the credentials only live in the secret
+        self.framework.observe(self.on.secret_changed, self._on_secret_changed)
         self.framework.observe(
             self.on.relational_db_relation_broken, self._on_database_relation_removed
         )
@@ -94,27 +217,86 @@ class ZenMLCharm(CharmBase):
             service_type = "ClusterIP"
             port = ServicePort(int(self._port), name=f"{self.app.name}")
 
-        self.service_patcher = KubernetesServicePatch(
+        self.service_patcher = SharedClientServicePatch(
             self,
             [port],
             service_type=service_type,
             service_name=f"{self.model.app.name}",
             refresh_event=self.on.config_changed,
+            client_provider=self._lightkube,
         )
 
     def _resource_spec_from_config(self) -> ResourceRequirements:
-        resource_limit = {
-            "cpu": self.model.config.get("cpu"),
-            "memory": self.model.config.get("memory"),
-        }
+        config = self.model.config
+        return resource_requirements(
+            limits={"cpu": config.get("cpu"), "memory": config.get("memory")},
+            requests={"cpu": config.get("cpu_request"), "memory": config.get("memory_request")},
+            qos=config["qos_class"],
+        )
+
+    def _check_resource_spec(self) -> None:
+        """Block the unit when the configured compute resources are not valid.
+
+        The resources patch reports the same error on its own, but is not able to hold the
+        unit status once the reconcile runs.
+        """
+        try:
+            self._resource_spec_from_config()
+        except ValueError as err:
+            raise ErrorWithStatus(f"Invalid resource configuration: {err}", BlockedStatus)
+
+    def _scheduling_spec_from_config(self) -> SchedulingSpec:
+        return SchedulingSpec(
+            anti_affinity=self.model.config["pod_anti_affinity"],
+            topology_spread_key=self.model.config["topology_spread_key"],
+        )
 
-        return adjust_resource_requirements(resource_limit, None)
+    def _check_scheduling_spec(self) -> None:
+        """Block the unit when the configured pod scheduling is not valid."""
+        try:
+            self._scheduling_spec_from_config()
+        except ValueError as err:
+            raise ErrorWithStatus(f"Invalid scheduling configuration: {err}", BlockedStatus)
+
+    def _check_shutdown_spec(self) -> None:
+        """Block the unit when the configured pod shutdown is not valid."""
+        try:
+            self._shutdown_spec_from_config()
+        except ValueError as err:
+            raise ErrorWithStatus(f"Invalid shutdown configuration: {err}", BlockedStatus)
+
+    @property
+    def _hook_name(self) -> str:
+        """Return the name of the dispatched hook."""
+        return os.environ.get("JUJU_DISPATCH_PATH", "").rpartition("/")[2] or "dispatch"
+
+    def _write_api_call_log(self, hook: str) -> None:
+        """Append this hook's Kubernetes API calls to the JSON log in the charm directory."""
+        log_file = self.charm_dir / K8S_API_CALL_LOG
+        try:
+            entries = json.loads(log_file.read_text()) if log_file.exists() else []
+        except ValueError:
+            entries = []
+        entries.append(self._lightkube.report(hook))
+        log_file.write_text(json.dumps(entries[-K8S_API_CALL_LOG_ENTRIES:]))
+
+    def _on_commit(self, _) -> None:
+        """Report the Kubernetes API calls made by this hook."""
+        if not self._lightkube.calls:
+            return
+        hook = self._hook_name
+        self.logger.info(self._lightkube.summary(hook))
+        if self.config["k8s_api_call_log"]:
+            self._write_api_call_log(hook)
 
     def _on_resource_patch_failed(self, event: K8sResourcePatchFailedEvent):
-        self.unit.status = BlockedStatus(typing.cast(str, event.message))
+        self._stored.reconcile_fingerprint = ""
+        self._patch_failure = typing.cast(str, event.message)
+        self.unit.status = BlockedStatus(self._patch_failure)
 
     def _get_env_vars(self, relational_db_data):
         """Return environment variables based on model configuration."""
+        pool = self._get_pool_settings()
 
         ret_env_vars = {
             "ZENML_STORE_TYPE": "sql",
@@ -125,13 +307,108 @@ class ZenMLCharm(CharmBase):
             "ZENML_DEFAULT_PROJECT_NAME": "default",
             "ZENML_DEFAULT_USER_NAME": "default",
             "ZENML_LOGGING_VERBOSITY": self.model.config.get("zenml_logging_verbosity", "INFO"),
+            "ZENML_STORE_POOL_SIZE": str(pool.pool_size),
+            "ZENML_STORE_MAX_OVERFLOW": str(pool.max_overflow),
+            "ZENML_STORE_POOL_PRE_PING": str(self.model.config["db_pool_pre_ping"]).lower(),
             # See other possible variables:
             # https://github.com/zenml-io/zenml/blob/04fb3ca0ab94c8bbef31a7794f3f330b2b9b7cf5/src/zenml/zen_server/deploy/helm/templates/server-deployment.yaml # noqa: E501
         }
         return ret_env_vars
 
+    def _get_workers(self) -> int:
+        """Return the number of server worker processes from the charm configuration."""
+        try:
+            return worker_count(self.model.config["workers"], self.model.config.get("cpu"))
+        except ValueError as err:
+            raise ErrorWithStatus(str(err), BlockedStatus)
+
+    def _get_pool_settings(self) -> PoolSettings:
+        """Return the SQL connection pool of each worker process.
+
+        The budget is split across the planned units, so each unit sizes its pool for the
+        scale Juju is heading to rather than the units already running.
+        """
+        config = self.model.config
+        processes = self.app.planned_units() * self._get_workers()
+        try:
+            return pool_settings(
+                config["db_pool_size"],
+                config["db_max_overflow"],
+                config["db_connection_budget"],
+                processes,
+            )
+        except ValueError as err:
+            raise ErrorWithStatus(str(err), BlockedStatus)
+
+    def _get_serving_command(self, workers: int) -> str:
+        """Return the zenml-server command line for the configured serving profile."""
+        config = self.model.config
+        try:
+            profile = serving_profile(config["serving_profile"])
+            if config["process_manager"] == "uvicorn":
+                return uvicorn_command(
+                    self._port,
+                    workers,
+                    profile,
+                    config["zenml_logging_verbosity"],
+                    graceful_timeout=config["graceful_timeout"],
+                )
+            if config["process_manager"] == "gunicorn":
+                return gunicorn_command(
+                    self._port,
+                    workers,
+                    profile,
+                    config["zenml_logging_verbosity"],
+                    max_requests=config["max_requests"],
+                    max_requests_jitter=config["max_requests_jitter"],
+                    graceful_timeout=config["graceful_timeout"],
+                    preload=config["preload"],
+                )
+        except ValueError as err:
+            raise ErrorWithStatus(str(err), BlockedStatus)
+        raise ErrorWithStatus(
+            f"Invalid process_manager {config['process_manager']!r}, "
+            "expected uvicorn or gunicorn",
+            BlockedStatus,
+        )
+
+    def _shutdown_timeout(self) -> int:
+        """Return the seconds a stopping server gets to finish its requests and exit."""
+        return max(self.model.config["graceful_timeout"], 0) + SHUTDOWN_MARGIN
+
+    def _shutdown_spec_from_config(self) -> ShutdownSpec:
+        drain_delay = self.model.config["drain_delay"]
+        return ShutdownSpec(
+            drain_delay=drain_delay, grace_period=drain_delay + self._shutdown_timeout()
+        )
+
+    def _health_check(self, level: str) -> dict:
+        """Return a Pebble check of `level` polling the server's health endpoint.
+
+        Raises:
+            ErrorWithStatus: if the health check options would be rejected by Pebble.
+        """
+        config = self.model.config
+        try:
+            check_health_check(
+                config["health_check_period"],
+                config["health_check_timeout"],
+                config["health_check_threshold"],
+            )
+        except ValueError as err:
+            raise ErrorWithStatus(str(err), BlockedStatus)
+        return {
+            "override": "replace",
+            "level": level,
+            "period": config["health_check_period"],
+            "timeout": config["health_check_timeout"],
+            "threshold": config["health_check_threshold"],
+            "http": {"url": f"http://localhost:{self._port}{HEALTH_PATH}"},
+        }
+
     def _charmed_zenml_layer(self, env_vars) -> Layer:
         """Create and return Pebble framework layer."""
+        workers = self._get_workers()
 
         layer_config = {
             "summary": "zenml-server layer",
@@ -140,35 +417,72 @@ class ZenMLCharm(CharmBase):
                 self._container_name: {
                     "override": "replace",
                     "summary": "Entrypoint of zenml-server image",
-                    "command": (
-                        "uvicorn "
-                        "zenml.zen_server.zen_server_api:app "
-                        "--log-level "
-                        "debug "
-                        "--proxy-headers "
-                        "--port "
-                        f"{self._port} "
-                        "--host "
-                        "0.0.0.0"
-                    ),
+                    "command": self._get_serving_command(workers),
                     "startup": "enabled",
-                    "environment": env_vars,
+                    # Read by the server and tooling that size themselves per worker process
+                    "environment": {**env_vars, "WEB_CONCURRENCY": str(workers)},
+                    "on-check-failure": {f"{self._container_name}-alive": "restart"},
+                    # Pebble sends SIGTERM, then SIGKILL once the server had time to drain
+                    "kill-delay": f"{self._shutdown_timeout()}s",
                 }
             },
+            "checks": {
+                f"{self._container_name}-ready": self._health_check("ready"),
+                f"{self._container_name}-alive": self._health_check("alive"),
+            },
         }
 
         return Layer(layer_config)
 
     def _get_interfaces(self):
         """Retrieve interface object."""
+        from serialized_data_interface import (
+            NoCompatibleVersions,
+            NoVersionsListed,
+            get_interface,
+        )
+
+        # get_interfaces() cannot read the peers section of metadata.yaml, so the endpoints
+        # with a schema are listed here
         try:
-            interfaces = get_interfaces(self)
+            interfaces = {endpoint: get_interface(self, endpoint) for endpoint in SDI_ENDPOINTS}
         except NoVersionsListed as err:
             raise ErrorWithStatus(err, WaitingStatus)
         except NoCompatibleVersions as err:
             raise ErrorWithStatus(err, BlockedStatus)
         return interfaces
 
+    def _select_db_endpoint(self, endpoints: str) -> str:
+        """Return the database endpoint the server connects to.
+
+        The server takes a single database URL, so it connects to the first published endpoint
+        accepting TCP connections. Endpoints are tried in the order the provider publishes them,
+        never ranked by this unit's latency, so every unit selects the same one. Failing over
+        changes ZENML_STORE_URL and restarts the servers one at a time like any other layer
+        change.
+
+        Raises:
+            ValueError: if no endpoint is published.
+        """
+        candidates = parse_endpoints(endpoints)
+        if not candidates:
+            raise ValueError("No database endpoints published")
+        self._stored.db_endpoints = ",".join(candidates)
+        endpoint = candidates[0]
+        if len(candidates) > 1:
+            endpoint = first_reachable(candidates, DB_ENDPOINT_PROBE_TIMEOUT)
+        if endpoint != self._stored.db_endpoint:
+            self.logger.info(f"Connecting to database endpoint {endpoint}")
+            self._stored.db_endpoint = endpoint
+        return endpoint
+
+    def _db_endpoint_moved(self) -> bool:
+        """Return True if the server should connect to another of the published endpoints."""
+        candidates = parse_endpoints(self._stored.db_endpoints)
+        if len(candidates) < 2:
+            return False
+        return first_reachable(candidates, DB_ENDPOINT_PROBE_TIMEOUT) != self._stored.db_endpoint
+
     def _get_relational_db_data(self) -> dict:
         mysql_relation = self.model.get_relation("relational-db")
 
@@ -182,29 +496,31 @@ class ZenMLCharm(CharmBase):
             if not val:
                 continue
             try:
-                host, port = val["endpoints"].split(":")
+                host, port = split_endpoint(self._select_db_endpoint(val["endpoints"]))
                 db_data = {
                     "host": host,
                     "port": port,
                     "username": val["username"],
                     "password": val["password"],
                 }
-            except KeyError:
+            except (KeyError, ValueError):
                 raise ErrorWithStatus(
                     "Incorrect data found in relation relational-db", WaitingStatus
                 )
             return db_data
         raise ErrorWithStatus("Waiting for relational-db relation data", WaitingStatus)
 
-    def _check_leader(self):
-        """Check if this unit is a leader."""
-        if not self.unit.is_leader():
-            self.logger.info("Not a leader, skipping setup")
-            raise ErrorWithStatus("Waiting for leadership", WaitingStatus)
-
-    def _update_layer(self, container, container_name, new_layer) -> None:
+    def _layer_changed(self, new_layer) -> bool:
+        """Return True if `new_layer` changes the services or checks of the Pebble plan."""
         current_layer = self.container.get_plan()
-        if current_layer.services != new_layer.services:
+        return (
+            current_layer.services != new_layer.services
+            or current_layer.checks != new_layer.checks
+        )
+
+    def _update_layer(self, container, container_name, new_layer) -> bool:
+        """Add `new_layer` and replan if it changes the plan, return True if it did."""
+        if self._layer_changed(new_layer):
             self.unit.status = MaintenanceStatus("Applying new pebble layer")
             container.add_layer(container_name, new_layer, combine=True)
             try:
@@ -214,6 +530,63 @@ class ZenMLCharm(CharmBase):
                 container.replan()
             except ChangeError as err:
                 raise ErrorWithStatus(f"Failed to replan with error: {str(err)}", BlockedStatus)
+            return True
+        return False
+
+    def _check_server_ready(self, timeout: float) -> None:
+        """Wait up to `timeout` seconds for the server to answer its health endpoint.
+
+        Pebble reports a check as up until it failed `threshold` times in a row, so a freshly
+        started server is probed directly as well.
+
+        Raises:
+            ErrorWithStatus: with WaitingStatus if the server is not ready in time.
+        """
+        checks = self.container.get_checks(level=CheckLevel.READY)
+        if all(check.status == CheckStatus.UP for check in checks.values()):
+            deadline = time.monotonic() + timeout
+            while True:
+                if server_ready(self._port, SERVER_READY_PROBE_TIMEOUT):
+                    return
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(SERVER_READY_POLL_INTERVAL)
+        raise ErrorWithStatus(f"Waiting for {self._container_name} to become ready", WaitingStatus)
+
+    def _refresh_workload_image(self) -> None:
+        """Record the registry path of the deployed oci-image resource."""
+        try:
+            resource_path = self.model.resources.fetch("oci-image")
+            resource = yaml.safe_load(resource_path.read_text()) or {}
+        except (ModelError, NameError, OSError, yaml.YAMLError) as err:
+            self.logger.warning(f"Could not read the oci-image resource: {err}")
+            resource = {}
+        self._stored.workload_image = resource.get("registrypath", "")
+
+    def _reconcile_fingerprint(self) -> str:
+        """Return a stable hash of all inputs `_on_event` reconciles against.
+
+        Relation databags are hashed as raw strings, so computing the fingerprint needs neither
+        interface schema validation, secret lookups nor a round-trip to Pebble. Databags only
+        hold the ID of the secret with the database credentials, so a rotation of its content
+        is picked up by `_on_secret_changed` instead.
+        """
+        relations = {}
+        for relation_name, relation_list in self.model.relations.items():
+            for relation in relation_list:
+                entities = [relation.app, *relation.units] if relation.app else relation.units
+                relations[f"{relation_name}:{relation.id}"] = {
+                    entity.name: dict(relation.data[entity]) for entity in entities
+                }
+        inputs = {
+            "leader": self.unit.is_leader(),
+            "config": dict(self.model.config),
+            "relations": relations,
+            "image": self._stored.workload_image,
+            # Connection pools are sized for the planned scale
+            "planned_units": self.app.planned_units(),
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
 
     def _on_pebble_ready(self, _):
         """Configure started container."""
@@ -221,11 +594,53 @@ class ZenMLCharm(CharmBase):
             # Pebble Ready event should indicate that container is available
             raise ErrorWithStatus("Pebble is ready and container is not ready", BlockedStatus)
 
-        # proceed with other actions
-        self._on_event(_)
+        # A (re)started container comes up with an empty plan, so always reconcile
+        self._refresh_workload_image()
+        self._on_event(_, force=True)
+
+    def _on_upgrade_charm(self, event) -> None:
+        """Reconcile after a charm or oci-image resource upgrade."""
+        # A new workload image may ship new schema revisions
+        self._stored.migration_state = MIGRATION_PENDING
+        # The PodDisruptionBudget template may have changed
+        self._stored.disruption_budget = None
+        if self.unit.is_leader():
+            self._remove_legacy_migration_job()
+        self._refresh_workload_image()
+        self._on_event(event, force=True)
+
+    def _remove_legacy_migration_job(self) -> None:
+        """Delete the migration Job of charm revisions that named it `<app>-db-migration`.
+
+        Those Jobs have neither an owner nor a TTL, so nothing else would ever remove them.
+        """
+        from lightkube.resources.batch_v1 import Job
+        from lightkube.types import CascadeType
+
+        if self._stored.legacy_migration_job_removed:
+            return
+        name = f"{self.app.name}-db-migration"
+        try:
+            self._lightkube.client.delete(
+                Job, name, namespace=self.model.name, cascade=CascadeType.BACKGROUND
+            )
+        except ApiError as err:
+            if err.status.code != 404:
+                self.logger.warning(f"Could not delete the legacy migration Job {name}: {err}")
+                return
+        self._stored.legacy_migration_job_removed = True
 
     def _on_database_relation_removed(self, _) -> None:
-        """Event is fired when relation with postgres is broken."""
+        """Event is fired when relation with postgres is broken.
+
+        The next related database may be a fresh one, so its migration starts over.
+        """
+        self._stored.reconcile_fingerprint = ""
+        self._stored.migration_state = MIGRATION_PENDING
+        self._stored.migration_target = ""
+        self._stored.migrated_schema = ""
+        if self.unit.is_leader():
+            self._publish_migration_state()
         self.unit.status = BlockedStatus("Please add relation to the database")
 
     def _check_and_report_k8s_conflict(self, error):
@@ -235,82 +650,403 @@ class ZenMLCharm(CharmBase):
             return True
         return False
 
-    def _get_job_status(self) -> dict:
-        return self._zenml_job_resource_handler.get_deployed_resources()[0].__dict__[
-            "_lazy_values"
-        ][
-            "status"
-        ]  # noqa: E501
-
-    @retry(wait=wait_fixed(1), stop=stop_after_attempt(30))
-    def _wait_for_job_completion(self, timeout=60, interval=1) -> str:
-        status: dict = self._get_job_status()
-        if status.get("failed"):
-            return "failed"
-        if status.get("succeeded"):
-            return "succeeded"
-        else:
-            self.logger.info(
-                f"ZenML Database migration job not completed, current status: {status}"
-            )
-            raise IOError("ZenML Database migration job not completed")
+    def _get_job_status(self) -> typing.Optional[JobStatus]:
+        """Return the status of the migration Job, or None if the Job does not exist."""
+        from lightkube.resources.batch_v1 import Job
 
-    def _on_database_created(self, event) -> None:
-        """Perform ZenML Database migration job on database created event"""
-        relational_db_data = self._get_relational_db_data()
-        job_env_vars = self._get_env_vars(relational_db_data)
-
-        """Check if initialized"""
-        if self._zenml_job_resource_handler:
-            """Check if job already run"""
-            if self._zenml_job_resource_handler.get_deployed_resources():
-                """Delete the current job resources"""
-                self._zenml_job_resource_handler.delete()
-        """The reason of initializing the KRH here is because of the relational_db_data being loaded on event"""  # noqa: E501
-        self._zenml_job_resource_handler = KubernetesResourceHandler(
-            field_manager="lightkube",
+        client = self._lightkube.client
+        name = self._stored.migration_job
+        if not name:
+            return None
+        status = watch_job_status(self._lightkube, name, self.model.name, MIGRATION_WATCH_TIMEOUT)
+        if status is not None:
+            return status
+        try:
+            return JobStatus.from_job(client.get(Job, name=name, namespace=self.model.name))
+        except ApiError as err:
+            if err.status.code == 404:
+                return None
+            raise
+
+    def _get_workload_pod(self) -> typing.Optional["Pod"]:
+        """Return this unit's pod, or None if it cannot be read."""
+        from lightkube.resources.core_v1 import Pod
+
+        pod_name = self.unit.name.replace("/", "-")
+        try:
+            return self._lightkube.client.get(Pod, name=pod_name, namespace=self.model.name)
+        except ApiError as err:
+            self.logger.warning(f"Could not read pod {pod_name}: {err}")
+            return None
+
+    def _get_workload_image(
+        self, pod: typing.Optional["Pod"]
+    ) -> typing.Tuple[str, typing.List[str]]:
+        """Return the image the zenml-server container runs and the pod's image pull secrets.
+
+        The image is pinned to the digest reported by the container runtime, so the migration
+        Job runs exactly the server's version and reuses the layers cached on the node.
+        """
+        if pod is None:
+            return self._stored.workload_image or DEFAULT_WORKLOAD_IMAGE, []
+        pull_secrets = [secret.name for secret in pod.spec.imagePullSecrets or []]
+        statuses = (pod.status.containerStatuses or []) if pod.status else []
+        for status in statuses:
+            if status.name == self._container_name:
+                return pinned_image(status.image, status.imageID), pull_secrets
+        for container in pod.spec.containers:
+            if container.name == self._container_name:
+                return container.image, pull_secrets
+        return self._stored.workload_image or DEFAULT_WORKLOAD_IMAGE, pull_secrets
+
+    def _get_zenml_job_resource_handler(self, env_vars: dict) -> "KubernetesResourceHandler":
+        """Return a KubernetesResourceHandler rendering the migration Job for `env_vars`.
+
+        The Job is named after its rendered manifest, see `migration_job_name`, and records
+        that name as the Job to follow.
+        """
+        from charmed_kubeflow_chisme.kubernetes import KubernetesResourceHandler
+        from lightkube.resources.batch_v1 import Job
+
+        pod = self._get_workload_pod()
+        image, image_pull_secrets = self._get_workload_image(pod)
+        owners = (pod.metadata.ownerReferences or []) if pod else []
+        # The StatefulSet outlives pod restarts, so the Job is garbage-collected with the app
+        owner = next((owner for owner in owners if owner.kind == "StatefulSet"), None)
+        context = {
+            "logging_verbosity": env_vars["ZENML_LOGGING_VERBOSITY"],
+            "app_name": self.app.name,
+            "namespace": self.model.name,
+            "database_url": env_vars["ZENML_STORE_URL"],
+            "default_project_name": env_vars["ZENML_DEFAULT_PROJECT_NAME"],
+            "default_user_name": env_vars["ZENML_DEFAULT_USER_NAME"],
+            "store_type": env_vars["ZENML_STORE_TYPE"],
+            "store_ssl_verify_server_cert": env_vars["ZENML_STORE_SSL_VERIFY_SERVER_CERT"],
+            "image": image,
+            "image_pull_secrets": image_pull_secrets,
+            "owner": owner,
+            "ttl_seconds_after_finished": MIGRATION_JOB_TTL,
+        }
+        self._stored.migration_job = migration_job_name(
+            self.app.name,
+            Path(ZENML_JOB[0]).read_text(),
+            context,
+            self._stored.migration_attempt,
+        )
+        return KubernetesResourceHandler(
+            field_manager=self._lightkube_field_manager,
             template_files=ZENML_JOB,
+            context={**context, "job_name": self._stored.migration_job},
+            resource_types={Job},
+            labels={"application_name": "zenml-database-migration", "scope": "all-resources"},
+            lightkube_client=self._lightkube.client,
+        )
+
+    def _disruption_budget(self) -> int:
+        """Return the number of pods a voluntary disruption may evict at once.
+
+        The configured `max_unavailable` is capped so that one unit always keeps serving. 0
+        means the application gets no PodDisruptionBudget, such as when it runs a single unit.
+        """
+        return max(min(self.config["max_unavailable"], self.app.planned_units() - 1), 0)
+
+    def _get_pdb_resource_handler(self, max_unavailable: int) -> "KubernetesResourceHandler":
+        """Return a KubernetesResourceHandler rendering the PodDisruptionBudget of the app."""
+        from charmed_kubeflow_chisme.kubernetes import KubernetesResourceHandler
+        from lightkube.resources.policy_v1 import PodDisruptionBudget
+
+        owner = None
+        if max_unavailable:
+            pod = self._get_workload_pod()
+            owners = (pod.metadata.ownerReferences or []) if pod else []
+            # Removed together with the StatefulSet, as the migration Job
+            owner = next((owner for owner in owners if owner.kind == "StatefulSet"), None)
+        return KubernetesResourceHandler(
+            field_manager=self._lightkube_field_manager,
+            template_files=ZENML_PDB,
             context={
-                "logging_verbosity": job_env_vars["ZENML_LOGGING_VERBOSITY"],
                 "app_name": self.app.name,
                 "namespace": self.model.name,
-                "database_url": job_env_vars["ZENML_STORE_URL"],
-                "default_project_name": job_env_vars["ZENML_DEFAULT_PROJECT_NAME"],
-                "default_user_name": job_env_vars["ZENML_DEFAULT_USER_NAME"],
-                "store_type": job_env_vars["ZENML_STORE_TYPE"],
-                "store_ssl_verify_server_cert": job_env_vars["ZENML_STORE_SSL_VERIFY_SERVER_CERT"],
+                "max_unavailable": max_unavailable,
+                "owner": owner,
             },
-            resource_types={Job},
-            labels={"application_name": "zenml-database-migration", "scope": "all-resources"},
+            resource_types={PodDisruptionBudget},
+            labels={"application_name": self.app.name, "scope": "disruption-budget"},
+            lightkube_client=self._lightkube.client,
         )
-        load_in_cluster_generic_resources(self._zenml_job_resource_handler.lightkube_client)
 
+    def _reconcile_disruption_budget(self) -> None:
+        """Create, resize or remove the PodDisruptionBudget of the zenml-server pods.
+
+        The budget follows the planned number of units and is only reconciled when its size
+        changed since the last successful run.
+        """
+        max_unavailable = self._disruption_budget()
+        if max_unavailable == self._stored.disruption_budget:
+            return
+        try:
+            self._get_pdb_resource_handler(max_unavailable).reconcile()
+        except ApiError as err:
+            self.logger.error(f"Failed to apply the PodDisruptionBudget: {err}")
+            raise ErrorWithStatus(f"Failed to apply the PodDisruptionBudget: {err}", BlockedStatus)
+        self._stored.disruption_budget = max_unavailable
+
+    def _start_migration_job(self, env_vars: dict) -> None:
+        """Apply the migration Job and mark the migration running.
+
+        Applying a Job that already exists under the same name is a no-op, so an identical,
+        already finished migration is only observed again rather than re-run.
+        """
+        from lightkube.generic_resource import load_in_cluster_generic_resources
+
+        self._zenml_job_resource_handler = self._get_zenml_job_resource_handler(env_vars)
         self.unit.status = MaintenanceStatus("Creating ZenML Database Migration Job resources")
+        load_in_cluster_generic_resources(self._zenml_job_resource_handler.lightkube_client)
         try:
             self._zenml_job_resource_handler.apply()
         except ApiError as err:
-            self.model.unit.status = err.status
             self.logger.error(f"Failed to run ZenML Database Migration Job: {err}")
-            self.unit.status = BlockedStatus(f"Failed to run ZenML Database Migration Job: {err}")
+            raise ErrorWithStatus(
+                f"Failed to run ZenML Database Migration Job: {err}", BlockedStatus
+            )
+        self._stored.migration_state = MIGRATION_RUNNING
+
+    def _check_migration_job(self) -> None:
+        """Advance a running migration, watching the Job for a bounded time."""
+        status = self._get_job_status()
+        if status is None:
+            self.logger.warning("ZenML Database migration job not found, recreating it")
+            self._stored.migration_state = MIGRATION_PENDING
+        elif status.finished:
+            self._stored.migration_state = status.state
+            if status.state == MIGRATION_SUCCEEDED:
+                self._stored.migrated_schema = self._stored.migration_target
+            else:
+                # The failed Job is left for inspection, a retry runs under a new name
+                self._stored.migration_attempt += 1
+        else:
+            self.logger.info(
+                f"ZenML Database migration job not completed, current status: {status}"
+            )
+
+    def _run_migration_exec(self, env_vars: dict) -> None:
+        """Run `zenml migrate-database` in the zenml-server container and record the outcome.
+
+        The migration runs with the same environment as the Job, its output is streamed to the
+        charm log and it is killed after `migration_timeout` seconds.
+
+        Raises:
+            ErrorWithStatus: with WaitingStatus if the container is not reachable yet.
+        """
+        if not self.container.can_connect():
+            raise ErrorWithStatus(
+                f"Waiting for {self._container_name} to run the database migration",
+                WaitingStatus,
+            )
+        self.unit.status = MaintenanceStatus("Running ZenML Database Migration")
+        environment = {name: env_vars[name] for name in MIGRATION_ENVIRONMENT}
+        try:
+            process = self.container.exec(
+                ["zenml", "migrate-database"],
+                environment=environment,
+                timeout=self.config["migration_timeout"],
+                combine_stderr=True,
+            )
+            for line in process.stdout:
+                self.logger.info(f"zenml migrate-database: {line.rstrip()}")
+            process.wait()
+        except (ChangeError, ExecError, APIError, TimeoutError) as err:
+            self.logger.error(f"ZenML Database Migration failed: {err}")
+            self._stored.migration_state = MIGRATION_FAILED
             return
+        self._stored.migration_state = MIGRATION_SUCCEEDED
+        self._stored.migrated_schema = self._stored.migration_target
 
-        self.unit.status = MaintenanceStatus(
-            "Waiting for ZenML Database Migration Job to complete"
-        )
+    def _schema_is_current(self, env_vars: dict) -> bool:
+        """Return True if the alembic version table is at the workload's head revision.
+
+        The check runs inside the zenml-server container, which ships ZenML's migrations and the
+        database driver, using the credentials from the relational-db relation.
+        """
+        if not self.config["migration_schema_check"] or not self.container.can_connect():
+            return False
         try:
-            status = self._wait_for_job_completion()
-            """Check if job succeeded"""
-            if status != "succeeded":
-                self.unit.status = BlockedStatus(
-                    "Failed to run ZenML Database Migration Job. Check zenml-database-migration job pod logs"  # noqa: E501
-                )
-        except IOError:
-            """Failed to run the job"""
-            self.unit.status = BlockedStatus(
-                "Failed to run ZenML Database Migration Job. Check zenml-database-migration job logs"  # noqa: E501
+            stdout, _ = self.container.exec(
+                ["python", "-c", SCHEMA_REVISION_PROBE],
+                environment={"ZENML_STORE_URL": env_vars["ZENML_STORE_URL"]},
+                timeout=SCHEMA_REVISION_PROBE_TIMEOUT,
+            ).wait_output()
+        except (ChangeError, ExecError, APIError, TimeoutError) as err:
+            self.logger.warning(f"Could not read the ZenML database schema revision: {err}")
+            return False
+        current, _, head = stdout.strip().partition(" ")
+        self.logger.info(f"ZenML database schema revision: {current}, image head: {head}")
+        return bool(head) and current == head
+
+    def _migration_target(self) -> str:
+        """Return the migration key of the deployed image and the related logical database.
+
+        The database is named by the relation, its application and the database name, never by
+        the endpoint this unit selected, so leader and non-leaders agree on the key. A database
+        related again under the same application name gets a new relation id, and a new key.
+        """
+        relation = self.model.get_relation("relational-db")
+        remote = f"{relation.app.name}:{relation.id}" if relation and relation.app else ""
+        return migration_key(self._stored.workload_image, f"{remote}/{self._database_name}")
+
+    def _migration_up_to_date(self, env_vars: dict) -> bool:
+        """Return True if the migration Job can be skipped for `env_vars`.
+
+        It can when this exact image already migrated this database, as recorded by this unit
+        or published by the leader before it, or when the schema is found to be at the head
+        revision.
+        """
+        target = self._migration_target()
+        published = self._peer_app_data().get("migrated-schema")
+        if target and target in (self._stored.migrated_schema, published):
+            self.logger.info("ZenML database already migrated by this image, skipping the Job")
+            self._stored.migrated_schema = target
+            return True
+        self._stored.migration_target = target
+        if self._schema_is_current(env_vars):
+            self.logger.info("ZenML database schema is at the head revision, skipping the Job")
+            self._stored.migrated_schema = target
+            return True
+        return False
+
+    def _reconcile_migration(self, env_vars: dict) -> None:
+        """Advance the database migration state machine.
+
+        Only the leader migrates the database and shares the outcome with the other units over
+        the peer relation, which wait for it before serving.
+
+        The migration goes pending -> running -> succeeded/failed, or straight from pending to
+        succeeded when the database is already migrated. Every hook that reaches this point
+        moves it forward, so no hook blocks waiting for the migration Job to finish. With
+        `migration_mode=exec` the migration instead runs to completion in this hook, in the
+        zenml-server container, before the server service is added to the plan.
+
+        Raises:
+            ErrorWithStatus: while the migration has not succeeded.
+        """
+        if not self.unit.is_leader():
+            self._check_leader_migration(env_vars)
+            return
+
+        exec_mode = self.config["migration_mode"] == "exec"
+        if self._stored.migration_state == MIGRATION_PENDING:
+            if self._migration_up_to_date(env_vars):
+                self._stored.migration_state = MIGRATION_SUCCEEDED
+            elif exec_mode:
+                self._run_migration_exec(env_vars)
+            else:
+                self._start_migration_job(env_vars)
+        if self._stored.migration_state == MIGRATION_RUNNING:
+            self._check_migration_job()
+        self._publish_migration_state()
+
+        if self._stored.migration_state == MIGRATION_FAILED and exec_mode:
+            raise ErrorWithStatus(
+                "Failed to run ZenML Database Migration. Check the charm logs", BlockedStatus
+            )
+        if self._stored.migration_state == MIGRATION_FAILED:
+            raise ErrorWithStatus(
+                "Failed to run ZenML Database Migration Job. Check zenml-database-migration job pod logs",  # noqa: E501
+                BlockedStatus,
+            )
+        if self._stored.migration_state != MIGRATION_SUCCEEDED:
+            raise ErrorWithStatus(
+                "Waiting for ZenML Database Migration Job to complete", MaintenanceStatus
+            )
+
+    def _peer_app_data(self) -> typing.Mapping[str, str]:
+        """Return the application databag of the peer relation, empty without the relation."""
+        relation = self.model.get_relation(PEER_RELATION)
+        return relation.data[self.app] if relation else {}
+
+    def _publish_migration_state(self) -> None:
+        """Share the leader's migration state with the other units through the peer relation."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return
+        relation.data[self.app].update(
+            {
+                "migration-state": self._stored.migration_state,
+                "migrated-schema": self._stored.migrated_schema,
+            }
+        )
+
+    def _grant_restart(self) -> None:
+        """Grant the rolling restart to the next unit, once the current holder released it.
+
+        A unit keeps the grant until its server answers the health check after the restart, so
+        a configuration that breaks the server stops the rollout on the first unit.
+        """
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None or not self.unit.is_leader():
+            return
+        requesters = sorted(
+            unit.name
+            for unit in (self.unit, *relation.units)
+            if relation.data[unit].get(RESTART_REQUEST)
+        )
+        granted = relation.data[self.app].get(RESTART_GRANTED, "")
+        if granted in requesters or not (granted or requesters):
+            return
+        relation.data[self.app][RESTART_GRANTED] = requesters[0] if requesters else ""
+
+    def _acquire_restart(self) -> bool:
+        """Request a restart from the leader, return True if this unit may restart now.
+
+        A unit that is not serving yet, or has no peers, restarts right away.
+        """
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None or not relation.units or not self.container.get_plan().services:
+            return True
+        relation.data[self.unit][RESTART_REQUEST] = "true"
+        self._grant_restart()
+        return relation.data[self.app].get(RESTART_GRANTED) == self.unit.name
+
+    def _release_restart(self) -> None:
+        """Withdraw this unit's restart request, letting the leader grant the next unit."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None or not relation.data[self.unit].get(RESTART_REQUEST):
+            return
+        del relation.data[self.unit][RESTART_REQUEST]
+        self._grant_restart()
+
+    def _check_leader_migration(self, env_vars: dict) -> None:
+        """Check that the leader migrated the database for the image this unit runs.
+
+        Raises:
+            ErrorWithStatus: until the leader reports a successful migration.
+        """
+        data = self._peer_app_data()
+        state = data.get("migration-state")
+        if state == MIGRATION_FAILED:
+            raise ErrorWithStatus(
+                "ZenML Database Migration failed, check the leader unit", BlockedStatus
+            )
+        if state != MIGRATION_SUCCEEDED:
+            raise ErrorWithStatus(
+                "Waiting for the leader to migrate the ZenML Database", WaitingStatus
             )
+        target = self._migration_target()
+        migrated = data.get("migrated-schema")
+        if target and migrated and migrated != target:
+            raise ErrorWithStatus(
+                "Waiting for the leader to migrate the ZenML Database for this unit's image",
+                WaitingStatus,
+            )
+
+    def _on_secret_changed(self, event) -> None:
+        """Reconcile with the new revision of a secret, such as rotated database credentials."""
+        self._on_event(event, force=True)
 
-        self._on_event(event)
+    def _on_database_created(self, event) -> None:
+        """Schedule the ZenML Database migration job on database created event."""
+        self._stored.migration_state = MIGRATION_PENDING
+        self._on_event(event, force=True)
 
     def _send_ingress_info(self, interfaces):
         if interfaces["ingress"]:
@@ -324,13 +1060,42 @@ class ZenMLCharm(CharmBase):
                 }
             )
 
-    def _on_event(self, event) -> None:
-        """Perform all required actions for the Charm."""
+    def _on_event(self, event, force: bool = False) -> None:
+        """Perform all required actions for the Charm.
+
+        Every unit runs the server, the Kubernetes Service balances requests across the ready
+        pods. Only the database migration, the PodDisruptionBudget and the ingress data are
+        left to the leader. Serving units restart one at a time, each waiting for its server to
+        become ready before the leader lets the next one go, so a configuration change never
+        takes all pods down.
+
+        The reconcile is skipped when none of its inputs changed since the last successful run,
+        unless `force` is set. Update-status also checks the database endpoint in use, so the
+        servers fail over once it stops accepting connections.
+        """
+        # Unit databags change as units request and release restarts
+        self._grant_restart()
+        fingerprint = self._reconcile_fingerprint()
+        if (
+            not force
+            and fingerprint == self._stored.reconcile_fingerprint
+            and not (isinstance(event, UpdateStatusEvent) and self._db_endpoint_moved())
+        ):
+            self.logger.debug(f"Event {event} skipped, charm inputs unchanged")
+            return
+
         try:
-            self._check_leader()
+            self._check_resource_spec()
+            self._check_scheduling_spec()
+            self._check_shutdown_spec()
+            if self._patch_failure:
+                raise ErrorWithStatus(self._patch_failure, BlockedStatus)
+            if self.unit.is_leader():
+                self._reconcile_disruption_budget()
             interfaces = self._get_interfaces()
             relational_db_data = self._get_relational_db_data()
             envs = self._get_env_vars(relational_db_data)
+            self._reconcile_migration(envs)
 
             if interfaces.get("ingress"):
                 envs["ZENML_SERVER_ROOT_URL_PATH"] = "/zenml"
@@ -339,14 +1104,22 @@ class ZenMLCharm(CharmBase):
                 raise ErrorWithStatus(
                     f"Container {self._container_name} is not ready", WaitingStatus
                 )
-            self._update_layer(
-                self.container, self._container_name, self._charmed_zenml_layer(envs)
-            )
-            self._send_ingress_info(interfaces)
+            layer = self._charmed_zenml_layer(envs)
+            if self._layer_changed(layer) and not self._acquire_restart():
+                raise ErrorWithStatus("Waiting for other units to restart", WaitingStatus)
+            replanned = self._update_layer(self.container, self._container_name, layer)
+            # Publish ingress data and let the next unit restart only once this server can
+            # take requests
+            self._check_server_ready(SERVER_READY_TIMEOUT if replanned else 0)
+            self._release_restart()
+            if self.unit.is_leader():
+                self._send_ingress_info(interfaces)
         except ErrorWithStatus as err:
+            self._stored.reconcile_fingerprint = ""
             self.model.unit.status = err.status
             self.logger.info(f"Event {event} stopped early with message: {str(err)}")
             return
+        self._stored.reconcile_fingerprint = fingerprint
         self.model.unit.status = ActiveStatus()
 
 
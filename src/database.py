@@ -0,0 +1,46 @@
+"""Endpoint selection for the relational-db relation."""
+
+import logging
+import socket
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_endpoints(endpoints: str) -> List[str]:
+    """Return the `host:port` entries of a comma-separated endpoints relation field."""
+    return [endpoint.strip() for endpoint in endpoints.split(",") if endpoint.strip()]
+
+
+def split_endpoint(endpoint: str) -> Tuple[str, str]:
+    """Split `host:port`, including bracketed IPv6 hosts, into host and port.
+
+    Raises:
+        ValueError: if the endpoint has no port.
+    """
+    host, separator, port = endpoint.rpartition(":")
+    if not separator or not host or not port:
+        raise ValueError(f"Invalid endpoint {endpoint!r}, expected host:port")
+    return host.strip("[]"), port
+
+
+def is_reachable(endpoint: str, timeout: float) -> bool:
+    """Return True if a TCP connection to `endpoint` succeeds within `timeout` seconds."""
+    host, port = split_endpoint(endpoint)
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            return True
+    except (OSError, ValueError) as err:
+        logger.info(f"Database endpoint {endpoint} is unreachable: {err}")
+        return False
+
+
+def first_reachable(endpoints: List[str], timeout: float) -> str:
+    """Return the first of `endpoints` accepting TCP connections, or the first one if none does.
+
+    The published order is kept, so every unit probing the same endpoints selects the same one.
+    """
+    for endpoint in endpoints:
+        if is_reachable(endpoint, timeout):
+            return endpoint
+    return endpoints[0]
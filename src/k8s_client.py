@@ -0,0 +1,225 @@
+"""Shared, instrumented lightkube client for a single charm dispatch."""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+import httpx
+from lightkube import Client
+from lightkube.config.client_adapter import user_cert, verify_cluster
+from lightkube.config.kubeconfig import KubeConfig, SingleConfig
+
+logger = logging.getLogger(__name__)
+
+# Resource kinds of the API paths the charm and its libs request, keyed by plural name
+_KINDS = {
+    "customresourcedefinitions": "CustomResourceDefinition",
+    "jobs": "Job",
+    "poddisruptionbudgets": "PodDisruptionBudget",
+    "pods": "Pod",
+    "services": "Service",
+    "statefulsets": "StatefulSet",
+}
+
+# Matches .../<plural> and .../<plural>/<name>[/<subresource>] of namespaced and global paths
+_RESOURCE_PATH = re.compile(
+    r"^/(?:api/v1|apis/[^/]+/[^/]+)(?:/namespaces/[^/]+)?/(?P<plural>[^/]+)(?:/[^/]+)*$"
+)
+
+
+@dataclass
+class ApiCall:
+    """A single request made to the Kubernetes API server."""
+
+    verb: str
+    kind: str
+    latency_ms: float
+    size: int = 0
+
+
+def _resource_kind(path: str) -> str:
+    match = _RESOURCE_PATH.match(path)
+    if not match:
+        return path
+    return _KINDS.get(match["plural"], match["plural"])
+
+
+class _CountingStream(httpx.SyncByteStream):
+    """Response stream adding the number of bytes read to an ApiCall."""
+
+    def __init__(self, stream: httpx.SyncByteStream, call: ApiCall):
+        self._stream = stream
+        self._call = call
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._call.size += len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+class _InstrumentedTransport(httpx.BaseTransport):
+    """httpx transport recording every request and the connections it opens.
+
+    The wrapped transport is built on the first request, from the configuration the lightkube
+    client resolved, so creating a client stays free of network and TLS setup.
+    """
+
+    def __init__(self, config_getter: Callable[[], SingleConfig], transport=None):
+        self._config_getter = config_getter
+        self._transport: Optional[httpx.BaseTransport] = transport
+        self.calls: List[ApiCall] = []
+        self.connections = 0
+        self.handshakes = 0
+        self._watches: Dict[threading.Thread, httpx.SyncByteStream] = {}
+        self._cancelled: Set[threading.Thread] = set()
+        self._lock = threading.Lock()
+
+    def _trace(self, event_name: str, _) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self.handshakes += 1
+
+    def _build_transport(self) -> httpx.BaseTransport:
+        config = self._config_getter()
+        return httpx.HTTPTransport(
+            verify=verify_cluster(config.cluster, config.abs_file),
+            cert=user_cert(config.user, config.abs_file),
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request through the wrapped transport and record it."""
+        if self._transport is None:
+            self._transport = self._build_transport()
+        request.extensions["trace"] = self._trace
+        verb = "WATCH" if request.url.params.get("watch") == "true" else request.method
+        thread = threading.current_thread()
+        if verb == "WATCH" and thread in self._cancelled:
+            raise httpx.ReadError("Watch cancelled", request=request)
+
+        start = time.perf_counter()
+        response = self._transport.handle_request(request)
+        call = ApiCall(
+            verb=verb,
+            kind=_resource_kind(request.url.path),
+            latency_ms=(time.perf_counter() - start) * 1000,
+        )
+        with self._lock:
+            self.calls.append(call)
+        if "content-length" in response.headers:
+            call.size = int(response.headers["content-length"])
+        else:
+            # Chunked responses, such as watch streams, are measured as they are read
+            response.stream = _CountingStream(response.stream, call)
+        if verb == "WATCH":
+            with self._lock:
+                cancelled = thread in self._cancelled
+                if not cancelled:
+                    self._watches[thread] = response.stream
+            if cancelled:
+                # The watch was cancelled while this request was in flight
+                response.stream.close()
+                raise httpx.ReadError("Watch cancelled", request=request)
+        return response
+
+    def cancel_watches(self, thread: threading.Thread) -> None:
+        """Close the watch stream opened by `thread` and fail the watches it opens later."""
+        with self._lock:
+            self._cancelled.add(thread)
+            stream = self._watches.pop(thread, None)
+        if stream is not None:
+            stream.close()
+
+    def close(self) -> None:
+        """Close the wrapped transport."""
+        if self._transport is not None:
+            self._transport.close()
+
+
+class LightkubeClientProvider:
+    """Lazily create one lightkube Client and share it with every user in the dispatch.
+
+    All users share the client's connection pool, so the kubeconfig is loaded once and the
+    TLS handshake with the API server is paid once per hook instead of once per user. Every
+    request made through the client is recorded, see `calls` and `summary`.
+    """
+
+    def __init__(
+        self,
+        field_manager: str,
+        config: Optional[KubeConfig] = None,
+        transport: Optional[httpx.BaseTransport] = None,
+    ):
+        self._field_manager = field_manager
+        self._config = config
+        self._inner_transport = transport
+        self._transport: Optional[_InstrumentedTransport] = None
+        self._client: Optional[Client] = None
+
+    @property
+    def client(self) -> Client:
+        """Return the shared lightkube Client, creating it on first use.
+
+        Raises:
+            lightkube.core.exceptions.ConfigError: if no Kubernetes configuration is found.
+        """
+        if self._client is None:
+            self._transport = _InstrumentedTransport(
+                lambda: self._client.config, self._inner_transport
+            )
+            self._client = Client(
+                config=self._config, field_manager=self._field_manager, transport=self._transport
+            )
+        return self._client
+
+    @property
+    def calls(self) -> List[ApiCall]:
+        """Return the requests made to the API server so far."""
+        return list(self._transport.calls) if self._transport else []
+
+    @property
+    def connections(self) -> int:
+        """Return the number of connections opened to the API server so far."""
+        return self._transport.connections if self._transport else 0
+
+    @property
+    def handshakes(self) -> int:
+        """Return the number of TLS handshakes performed with the API server so far."""
+        return self._transport.handshakes if self._transport else 0
+
+    def cancel_watches(self, thread: threading.Thread) -> None:
+        """Stop the watches `thread` makes through the client.
+
+        Its open watch stream is closed and lightkube's attempts to re-open it fail, so the
+        watch ends instead of outliving its caller.
+        """
+        if self._transport is not None:
+            self._transport.cancel_watches(thread)
+
+    def summary(self, hook: str) -> str:
+        """Return a one-line summary of the requests, e.g. `update-status: 2 calls, 9 ms, ...`."""
+        calls = self.calls
+        total_ms = sum(call.latency_ms for call in calls)
+        groups = Counter(f"{call.verb} {call.kind}" for call in calls)
+        details = ", ".join(f"{count} {group}" for group, count in groups.most_common())
+        return (
+            f"{hook}: {len(calls)} calls, {total_ms:.0f} ms, {details} "
+            f"({self.connections} connections, {self.handshakes} TLS handshakes)"
+        )
+
+    def report(self, hook: str) -> dict:
+        """Return the requests made in this dispatch as a JSON-serialisable dict."""
+        return {
+            "hook": hook,
+            "timestamp": time.time(),
+            "connections": self.connections,
+            "handshakes": self.handshakes,
+            "calls": [asdict(call) for call in self.calls],
+        }
@@ -0,0 +1,455 @@
+"""Kubernetes patch libraries bound to the charm's shared lightkube client.
+
+The upstream charm libraries each create their own lightkube `Client`. The subclasses below take
+a `LightkubeClientProvider` instead, so every patch in a dispatch reuses a single connection pool.
+`SchedulingPatch` and `ShutdownPatch` patch the pod template through the StatefulSet cached by
+the resources patch.
+"""
+
+import abc
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+
+from charms.observability_libs.v0.kubernetes_compute_resources_patch import (
+    K8sResourcePatchEvents,
+    KubernetesComputeResourcesPatch,
+    ResourcePatcher,
+    ResourceRequirements,
+    equals_canonically,
+)
+from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
+from lightkube import ApiError, Client
+from lightkube.core import exceptions
+from lightkube.models.apps_v1 import StatefulSetSpec
+from lightkube.models.core_v1 import (
+    Affinity,
+    Container,
+    ExecAction,
+    Lifecycle,
+    LifecycleHandler,
+    PodAffinityTerm,
+    PodAntiAffinity,
+    PodSpec,
+    PodTemplateSpec,
+    TopologySpreadConstraint,
+    WeightedPodAffinityTerm,
+)
+from lightkube.models.meta_v1 import LabelSelector
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.resources.core_v1 import Pod, Service
+from lightkube.types import PatchType
+from ops.charm import CharmBase
+from ops.framework import BoundEvent, Object
+
+from k8s_client import LightkubeClientProvider
+
+logger = logging.getLogger(__name__)
+
+ANTI_AFFINITY_NONE = "none"
+ANTI_AFFINITY_PREFERRED = "preferred"
+ANTI_AFFINITY_REQUIRED = "required"
+HOSTNAME_TOPOLOGY_KEY = "kubernetes.io/hostname"
+
+
+class SharedClientServicePatch(KubernetesServicePatch):
+    """`KubernetesServicePatch` using the charm's shared lightkube client."""
+
+    def __init__(self, *args, client_provider: LightkubeClientProvider, **kwargs):
+        self._client_provider = client_provider
+        super().__init__(*args, **kwargs)
+
+    def _patch(self, _) -> None:
+        """Patch the Kubernetes service created by Juju to map the correct port."""
+        try:
+            client = self._client_provider.client
+        except exceptions.ConfigError as e:
+            logger.warning("Error creating k8s client: %s", e)
+            return
+
+        try:
+            if self._is_patched(client):
+                return
+            if self.service_name != self._app:
+                self._delete_and_create_service(client)
+            client.patch(Service, self.service_name, self.service, patch_type=PatchType.MERGE)
+        except ApiError as e:
+            if e.status.code == 403:
+                logger.error("Kubernetes service patch failed: `juju trust` this application.")
+            else:
+                logger.error("Kubernetes service patch failed: %s", str(e))
+        else:
+            logger.info("Kubernetes service '%s' patched successfully", self._app)
+
+    def is_patched(self) -> bool:
+        """Reports if the service patch has been applied."""
+        return self._is_patched(self._client_provider.client)
+
+
+class SharedClientResourcePatcher(ResourcePatcher):
+    """`ResourcePatcher` resolving its client from a provider on first use.
+
+    The upstream patcher GETs the StatefulSet and the Pod again for every question it answers,
+    up to four times in `is_ready`. This one fetches each object once per dispatch and keeps
+    the StatefulSet returned by its own patch. Kubernetes has no conditional GET, so the cache
+    is the only way to skip the round-trips; call `refresh` to read fresh objects.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        statefulset_name: str,
+        container_name: str,
+        client_provider: LightkubeClientProvider,
+    ):
+        # The parent constructor is skipped on purpose: it would create a dedicated Client
+        self.namespace = namespace
+        self.statefulset_name = statefulset_name
+        self.container_name = container_name
+        self._client_provider = client_provider
+        self._statefulset: Optional[StatefulSet] = None
+        self._pods: Dict[str, Pod] = {}
+
+    @property
+    def client(self) -> Client:
+        """Return the shared lightkube client."""
+        return self._client_provider.client
+
+    @property
+    def statefulset(self) -> StatefulSet:
+        """Return the StatefulSet, fetched once until the next `refresh`."""
+        return self._get_statefulset()
+
+    @statefulset.setter
+    def statefulset(self, statefulset: StatefulSet) -> None:
+        """Keep the StatefulSet returned by a patch of another field manager."""
+        self._statefulset = statefulset
+
+    def refresh(self) -> None:
+        """Forget the fetched objects, so the next check reads them from the API server."""
+        self._statefulset = None
+        self._pods.clear()
+
+    def _get_statefulset(self) -> StatefulSet:
+        if self._statefulset is None:
+            self._statefulset = self.client.get(
+                StatefulSet, name=self.statefulset_name, namespace=self.namespace
+            )
+        return self._statefulset
+
+    def _get_pod(self, pod_name: str) -> Pod:
+        if pod_name not in self._pods:
+            self._pods[pod_name] = self.client.get(Pod, name=pod_name, namespace=self.namespace)
+        return self._pods[pod_name]
+
+    def _patched_delta(self, resource_reqs: ResourceRequirements) -> StatefulSet:
+        statefulset = self._get_statefulset()
+        return StatefulSet(
+            spec=StatefulSetSpec(
+                selector=statefulset.spec.selector,
+                serviceName=statefulset.spec.serviceName,
+                template=PodTemplateSpec(
+                    spec=PodSpec(
+                        containers=[Container(name=self.container_name, resources=resource_reqs)]
+                    )
+                ),
+            )
+        )
+
+    def get_templated(self) -> Optional[ResourceRequirements]:
+        """Returns the resource limits specified in the StatefulSet template."""
+        containers = self._get_statefulset().spec.template.spec.containers
+        return self._get_container(self.container_name, containers).resources
+
+    def get_actual(self, pod_name: str) -> Optional[ResourceRequirements]:
+        """Return the resource limits that are in effect for the container in the given pod."""
+        containers = self._get_pod(pod_name).spec.containers
+        return self._get_container(self.container_name, containers).resources
+
+    def is_ready(self, pod_name, resource_reqs: ResourceRequirements):
+        """Reports if the resource patch has been applied and is in effect."""
+        templated = self.get_templated()
+        actual = self.get_actual(pod_name)
+        logger.info("reqs=%s, templated=%s, actual=%s", resource_reqs, templated, actual)
+        return equals_canonically(templated, resource_reqs) and equals_canonically(
+            resource_reqs, actual
+        )
+
+    def apply(self, resource_reqs: ResourceRequirements) -> None:
+        """Patch the Kubernetes resources created by Juju to limit cpu or mem."""
+        if self.is_patched(resource_reqs):
+            return
+
+        self._statefulset = self.client.patch(
+            StatefulSet,
+            self.statefulset_name,
+            self._patched_delta(resource_reqs),
+            namespace=self.namespace,
+            patch_type=PatchType.APPLY,
+            field_manager=ResourcePatcher.__name__,
+        )
+        # The pods only pick up the new template once they are recreated
+        self._pods.clear()
+
+
+class SharedClientResourcesPatch(KubernetesComputeResourcesPatch):
+    """`KubernetesComputeResourcesPatch` using the charm's shared lightkube client."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        container_name: str,
+        *,
+        resource_reqs_func: Callable[[], ResourceRequirements],
+        client_provider: LightkubeClientProvider,
+        refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+    ):
+        # Mirrors KubernetesComputeResourcesPatch.__init__, which would create its own Client
+        key = "{}_{}".format(KubernetesComputeResourcesPatch.__name__, container_name)
+        Object.__init__(self, charm, key)
+        self._charm = charm
+        self._container_name = container_name
+        self.resource_reqs_func = resource_reqs_func
+        self.patcher = SharedClientResourcePatcher(
+            self._namespace, self._app, container_name, client_provider
+        )
+
+        self.framework.observe(charm.on.config_changed, self._on_config_changed)
+
+        if not refresh_event:
+            refresh_event = []
+        elif not isinstance(refresh_event, list):
+            refresh_event = [refresh_event]
+        for ev in refresh_event:
+            self.framework.observe(ev, self._on_config_changed)
+
+
+@dataclass(frozen=True)
+class SchedulingSpec:
+    """How the application's pods are spread across the cluster.
+
+    `anti_affinity` keeps pods off nodes already running one, as a scheduling preference or
+    as a hard requirement. `topology_spread_key` is a node label, such as
+    `topology.kubernetes.io/zone`, the pods are spread evenly across; empty disables it.
+    """
+
+    anti_affinity: str = ANTI_AFFINITY_PREFERRED
+    topology_spread_key: str = ""
+
+    def __post_init__(self):
+        modes = (ANTI_AFFINITY_NONE, ANTI_AFFINITY_PREFERRED, ANTI_AFFINITY_REQUIRED)
+        if self.anti_affinity not in modes:
+            raise ValueError(
+                f"pod anti-affinity must be one of {', '.join(modes)}, "
+                f"not '{self.anti_affinity}'"
+            )
+
+    def pod_anti_affinity(self, labels: Dict[str, str]) -> Optional[PodAntiAffinity]:
+        """Return the anti-affinity between the pods matching `labels`, None if disabled."""
+        term = PodAffinityTerm(
+            topologyKey=HOSTNAME_TOPOLOGY_KEY, labelSelector=LabelSelector(matchLabels=labels)
+        )
+        if self.anti_affinity == ANTI_AFFINITY_REQUIRED:
+            return PodAntiAffinity(requiredDuringSchedulingIgnoredDuringExecution=[term])
+        if self.anti_affinity == ANTI_AFFINITY_PREFERRED:
+            return PodAntiAffinity(
+                preferredDuringSchedulingIgnoredDuringExecution=[
+                    WeightedPodAffinityTerm(weight=100, podAffinityTerm=term)
+                ]
+            )
+        return None
+
+    def topology_spread_constraints(
+        self, labels: Dict[str, str]
+    ) -> Optional[List[TopologySpreadConstraint]]:
+        """Return the spread constraints of the pods matching `labels`, None if disabled.
+
+        The constraint only scores nodes, so pods still schedule when a domain is full.
+        """
+        if not self.topology_spread_key:
+            return None
+        return [
+            TopologySpreadConstraint(
+                maxSkew=1,
+                topologyKey=self.topology_spread_key,
+                whenUnsatisfiable="ScheduleAnyway",
+                labelSelector=LabelSelector(matchLabels=labels),
+            )
+        ]
+
+
+@dataclass(frozen=True)
+class ShutdownSpec:
+    """How a terminating zenml-server pod drains before it is killed.
+
+    The container keeps serving for `drain_delay` seconds after the pod is removed from the
+    Service endpoints, so clients stop being routed to it before the server stops accepting
+    connections. The pod is killed `grace_period` seconds after its termination started.
+    """
+
+    drain_delay: int = 5
+    grace_period: int = 30
+
+    def __post_init__(self):
+        if self.drain_delay < 0:
+            raise ValueError(f"drain delay must be 0 or more, not {self.drain_delay}")
+        if self.grace_period < self.drain_delay:
+            raise ValueError(
+                f"grace period {self.grace_period} must cover the drain delay {self.drain_delay}"
+            )
+
+
+class _PodTemplatePatch(Object, abc.ABC):
+    """Base of patches server-side applying part of the Juju StatefulSet's pod template.
+
+    Like `KubernetesComputeResourcesPatch`, each patch applies under its own field manager, the
+    class name. Settings left out of the spec are therefore removed by the next patch, while
+    fields of other managers, such as the node affinity Juju derives from constraints, are kept.
+
+    The StatefulSet is read from and written back to the cache of the resources patch `patcher`,
+    so every patch of a dispatch shares a single GET. A failed patch emits `patch_failed`.
+    """
+
+    on = K8sResourcePatchEvents()
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        *,
+        spec_func: Callable,
+        patcher: SharedClientResourcePatcher,
+        refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+    ):
+        super().__init__(charm, type(self).__name__)
+        self._app = charm.app.name
+        self._namespace = charm.model.name
+        self._spec_func = spec_func
+        self._patcher = patcher
+
+        self.framework.observe(charm.on.config_changed, self._patch)
+        if not refresh_event:
+            refresh_event = []
+        elif not isinstance(refresh_event, list):
+            refresh_event = [refresh_event]
+        for ev in refresh_event:
+            self.framework.observe(ev, self._patch)
+
+    @abc.abstractmethod
+    def _pod_spec(self, statefulset: StatefulSet, spec) -> PodSpec:
+        """Return the part of the pod template this patch owns."""
+
+    @abc.abstractmethod
+    def _is_patched(self, current: PodSpec, desired: PodSpec) -> bool:
+        """Return True if the `current` pod template already matches the `desired` part."""
+
+    def _patch(self, _=None) -> None:
+        """Apply the spec to the StatefulSet, unless it is already in place."""
+        name = type(self).__name__
+        try:
+            spec = self._spec_func()
+        except ValueError as e:
+            msg = f"Invalid {name} configuration: {e}"
+            logger.error(msg)
+            self.on.patch_failed.emit(message=msg)
+            return
+        try:
+            client = self._patcher.client
+        except exceptions.ConfigError as e:
+            logger.warning("Error creating k8s client: %s", e)
+            return
+
+        try:
+            statefulset = self._patcher.statefulset
+            pod_spec = self._pod_spec(statefulset, spec)
+            if self._is_patched(statefulset.spec.template.spec, pod_spec):
+                return
+            delta = StatefulSet(
+                spec=StatefulSetSpec(
+                    selector=statefulset.spec.selector,
+                    serviceName=statefulset.spec.serviceName,
+                    template=PodTemplateSpec(spec=pod_spec),
+                )
+            )
+            self._patcher.statefulset = client.patch(
+                StatefulSet,
+                self._app,
+                delta,
+                namespace=self._namespace,
+                patch_type=PatchType.APPLY,
+                field_manager=name,
+            )
+        except ApiError as e:
+            if e.status.code == 403:
+                msg = f"Kubernetes {name} failed: `juju trust` this application. {e}"
+            else:
+                msg = f"Kubernetes {name} failed: {e}"
+            logger.error(msg)
+            self.on.patch_failed.emit(message=msg)
+        else:
+            logger.info("Kubernetes %s of '%s' applied", name, self._app)
+
+
+class SchedulingPatch(_PodTemplatePatch):
+    """Patch pod anti-affinity and topology spread constraints into the Juju StatefulSet."""
+
+    def _pod_spec(self, statefulset: StatefulSet, spec: SchedulingSpec) -> PodSpec:
+        labels = statefulset.spec.selector.matchLabels
+        anti_affinity = spec.pod_anti_affinity(labels)
+        return PodSpec(
+            containers=[],
+            affinity=Affinity(podAntiAffinity=anti_affinity) if anti_affinity else None,
+            topologySpreadConstraints=spec.topology_spread_constraints(labels),
+        )
+
+    def _is_patched(self, current: PodSpec, desired: PodSpec) -> bool:
+        current_anti_affinity = current.affinity.podAntiAffinity if current.affinity else None
+        desired_anti_affinity = desired.affinity.podAntiAffinity if desired.affinity else None
+        return (
+            current_anti_affinity == desired_anti_affinity
+            and current.topologySpreadConstraints == desired.topologySpreadConstraints
+        )
+
+
+class ShutdownPatch(_PodTemplatePatch):
+    """Patch the termination grace period and a draining preStop hook into the StatefulSet.
+
+    The hook sleeps in the workload container, which needs a `sleep` executable in its image.
+    The grace period covers every container of the pod, so it is never lowered below the one
+    another field manager, such as Juju for the charm container, templated. The value this
+    patch applied itself follows the spec both ways.
+    """
+
+    def __init__(self, charm: CharmBase, container_name: str, **kwargs):
+        super().__init__(charm, **kwargs)
+        self._container_name = container_name
+
+    def _pod_spec(self, statefulset: StatefulSet, spec: ShutdownSpec) -> PodSpec:
+        lifecycle = None
+        if spec.drain_delay:
+            lifecycle = Lifecycle(
+                preStop=LifecycleHandler(exec=ExecAction(command=["sleep", str(spec.drain_delay)]))
+            )
+        return PodSpec(
+            containers=[Container(name=self._container_name, lifecycle=lifecycle)],
+            terminationGracePeriodSeconds=max(
+                self._foreign_grace_period(statefulset), spec.grace_period
+            ),
+        )
+
+    def _foreign_grace_period(self, statefulset: StatefulSet) -> int:
+        """Return the grace period templated by another field manager, 0 if there is none."""
+        for entry in statefulset.metadata.managedFields or []:
+            if entry.manager == type(self).__name__:
+                continue
+            template = (entry.fieldsV1 or {}).get("f:spec", {}).get("f:template", {})
+            if "f:terminationGracePeriodSeconds" in template.get("f:spec", {}):
+                return statefulset.spec.template.spec.terminationGracePeriodSeconds or 0
+        return 0
+
+    def _is_patched(self, current: PodSpec, desired: PodSpec) -> bool:
+        container = next((c for c in current.containers if c.name == self._container_name), None)
+        return (
+            container is not None
+            and container.lifecycle == desired.containers[0].lifecycle
+            and current.terminationGracePeriodSeconds == desired.terminationGracePeriodSeconds
+        )
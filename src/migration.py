@@ -0,0 +1,172 @@
+"""Helpers for the ZenML database migration Job."""
+
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from lightkube.resources.batch_v1 import Job
+
+    from k8s_client import LightkubeClientProvider
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_PENDING = "pending"
+MIGRATION_RUNNING = "running"
+MIGRATION_SUCCEEDED = "succeeded"
+MIGRATION_FAILED = "failed"
+
+# Prints "<current revision> <head revision>" of the ZenML schema, run in the workload container
+SCHEMA_REVISION_PROBE = """
+import os
+from sqlalchemy import create_engine
+from zenml.zen_stores.migrations.alembic import Alembic
+
+url = os.environ["ZENML_STORE_URL"].replace("mysql://", "mysql+pymysql://", 1)
+alembic = Alembic(create_engine(url))
+print(",".join(sorted(alembic.current_revisions())), ",".join(sorted(alembic.head_revisions())))
+"""
+
+
+def migration_key(image: str, database: str) -> str:
+    """Return an identifier of the schema `image` migrates the logical `database` to.
+
+    `database` names the database independently of the endpoint and credentials a unit
+    connects with, so every unit computes the same key and rotating credentials or failing
+    over to another endpoint does not trigger a new migration.
+
+    Returns:
+        The key, or an empty string when the image is unknown.
+    """
+    if not image:
+        return ""
+    return hashlib.sha256(f"{image}\n{database}".encode()).hexdigest()
+
+
+def migration_job_name(app_name: str, template: str, context: dict, attempt: int = 0) -> str:
+    """Return the name of the migration Job rendered from `template` and `context`.
+
+    The name is a hash of the rendered manifest, so an unchanged migration maps onto the Job
+    that already ran it while any change to what the Job runs, credentials included, gets a
+    new Job. A Job's pod template cannot be updated in place. `attempt` gives a retry of a
+    failed Job a fresh name.
+    """
+    from jinja2 import Template
+
+    manifest = Template(template).render(**{**context, "job_name": ""})
+    content = f"{manifest}\n{attempt}"
+    return f"{app_name}-db-migration-{hashlib.sha256(content.encode()).hexdigest()[:10]}"
+
+
+def pinned_image(image: str, image_id: str) -> str:
+    """Return a digest-pinned reference of a container image.
+
+    `image` and `image_id` are the fields of a Pod's container status. The runtime reports the
+    digest in `image_id`, possibly behind a scheme such as `docker-pullable://`.
+
+    Returns:
+        `repository@sha256:...` when the digest is known, `image` otherwise.
+    """
+    reference = image_id.partition("://")[2] or image_id
+    if "@sha256:" not in reference:
+        return image
+    return reference
+
+
+@dataclass(frozen=True)
+class JobStatus:
+    """Typed view of the fields of a Job's status the charm acts on."""
+
+    active: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    complete: bool = False
+    failed_condition: bool = False
+
+    @classmethod
+    def from_job(cls, job: "Job") -> "JobStatus":
+        """Build a JobStatus from a lightkube Job."""
+        status = job.status
+        if status is None:
+            return cls()
+        conditions = {
+            condition.type: condition.status == "True" for condition in status.conditions or []
+        }
+        return cls(
+            active=status.active or 0,
+            succeeded=status.succeeded or 0,
+            failed=status.failed or 0,
+            complete=conditions.get("Complete", False),
+            failed_condition=conditions.get("Failed", False),
+        )
+
+    @property
+    def state(self) -> str:
+        """Return the migration state matching this Job status.
+
+        Failed pods alone do not fail the Job while it still has retries left in its
+        `backoffLimit`, only the `Failed` condition does.
+        """
+        if self.complete or self.succeeded:
+            return MIGRATION_SUCCEEDED
+        if self.failed_condition:
+            return MIGRATION_FAILED
+        return MIGRATION_RUNNING
+
+    @property
+    def finished(self) -> bool:
+        """Return True if the Job reached a terminal state."""
+        return self.state != MIGRATION_RUNNING
+
+
+def watch_job_status(
+    client_provider: "LightkubeClientProvider", name: str, namespace: str, timeout: int
+) -> Optional[JobStatus]:
+    """Watch a Job until it finishes, for at most `timeout` seconds.
+
+    A single watch request filtered on the Job name replaces repeated GETs. Its first event
+    carries the current state and later events arrive as soon as the Job changes. The watch
+    runs in a daemon thread because lightkube transparently re-opens watch streams closed by
+    the server. Once `timeout` expires the watch is cancelled, so the thread neither blocks
+    the caller nor keeps using the shared client for the rest of the dispatch.
+
+    Returns:
+        The last observed status, or None if no event was received for the Job.
+    """
+    from lightkube.resources.batch_v1 import Job
+
+    client = client_provider.client
+    observed = {}
+    done = threading.Event()
+    cancelled = threading.Event()
+
+    def _watch():
+        try:
+            for event_type, job in client.watch(
+                Job,
+                namespace=namespace,
+                fields={"metadata.name": name},
+                server_timeout=timeout,
+            ):
+                if cancelled.is_set():
+                    break
+                if event_type == "DELETED":
+                    observed.pop("status", None)
+                    break
+                observed["status"] = JobStatus.from_job(job)
+                if observed["status"].finished:
+                    break
+        except Exception as err:  # the watch thread must never die silently
+            if not cancelled.is_set():
+                logger.warning(f"Watching Job {name} failed: {err}")
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=_watch, name=f"watch-{name}", daemon=True)
+    thread.start()
+    if not done.wait(timeout):
+        cancelled.set()
+        client_provider.cancel_watches(thread)
+    return observed.get("status")
@@ -0,0 +1,60 @@
+"""Compute resource requirements of the zenml-server container."""
+
+from typing import Dict, Optional
+
+from charms.observability_libs.v0.kubernetes_compute_resources_patch import (
+    ResourceRequirements,
+    adjust_resource_requirements,
+)
+from lightkube.utils.quantity import parse_quantity
+
+GUARANTEED = "Guaranteed"
+BURSTABLE = "Burstable"
+BEST_EFFORT = "BestEffort"
+
+_QOS_HINTS = {
+    GUARANTEED: "set cpu and memory, and leave their requests unset or equal to them",
+    BURSTABLE: "set a cpu_request or memory_request below its limit, or leave a limit unset",
+    BEST_EFFORT: "leave cpu, memory and their requests unset",
+}
+
+
+def qos_class(limits: Dict[str, str], requests: Dict[str, str]) -> str:
+    """Return the QoS class Kubernetes assigns to a pod whose only container has this spec."""
+    if not limits and not requests:
+        return BEST_EFFORT
+    for resource in ("cpu", "memory"):
+        limit = limits.get(resource)
+        if not limit or parse_quantity(requests.get(resource, limit)) != parse_quantity(limit):
+            return BURSTABLE
+    return GUARANTEED
+
+
+def resource_requirements(
+    limits: Dict[str, Optional[str]],
+    requests: Dict[str, Optional[str]],
+    qos: str = "",
+) -> ResourceRequirements:
+    """Return the resource requirements for `limits` and `requests`, checked against `qos`.
+
+    Unset requests default to their limit, as Kubernetes does. An empty `qos` accepts any
+    QoS class.
+
+    Raises:
+        ValueError: if a quantity is invalid, a request exceeds its limit, or the requirements
+            do not give the `qos` class.
+    """
+    if qos and qos not in _QOS_HINTS:
+        raise ValueError(f"Invalid qos_class {qos!r}, expected one of {', '.join(_QOS_HINTS)}")
+    limits = {resource: value for resource, value in limits.items() if value}
+    requests = {resource: value for resource, value in requests.items() if value}
+    for resource, request in requests.items():
+        limit = limits.get(resource)
+        if limit and parse_quantity(request) > parse_quantity(limit):
+            raise ValueError(f"{resource} request {request} is above the {resource} limit {limit}")
+
+    reqs = adjust_resource_requirements(limits, requests)
+    actual = qos_class(reqs.limits, reqs.requests)
+    if qos and actual != qos:
+        raise ValueError(f"Resources give QoS class {actual}, for {qos} {_QOS_HINTS[qos]}")
+    return reqs
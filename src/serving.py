@@ -0,0 +1,279 @@
+"""Command line and process settings of the zenml-server Pebble service."""
+
+import math
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from lightkube.utils.quantity import parse_quantity
+
+ZENML_APP = "zenml.zen_server.zen_server_api:app"
+HEALTH_PATH = "/health"
+
+# Go duration, as Pebble parses check periods and timeouts, and the seconds of each unit
+_DURATION = re.compile(r"(?:(?:\d+\.?\d*|\.\d+)(?:ns|us|µs|ms|s|m|h))+")
+_DURATION_PART = re.compile(r"(\d+\.?\d*|\.\d+)(ns|us|µs|ms|s|m|h)")
+_DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1, "m": 60, "h": 3600}
+
+# uvicorn log level for each ZenML logging verbosity
+_LOG_LEVELS = {
+    "CRITICAL": "critical",
+    "ERROR": "error",
+    "WARN": "warning",
+    "WARNING": "warning",
+    "INFO": "info",
+    "DEBUG": "debug",
+    "NOTSET": "info",
+}
+
+
+@dataclass(frozen=True)
+class ServingProfile:
+    """Bundle of uvicorn settings selected by the `serving_profile` option.
+
+    A None `log_level` follows `zenml_logging_verbosity`, other None values keep uvicorn's
+    defaults.
+    """
+
+    log_level: Optional[str]
+    access_log: bool = True
+    timeout_keep_alive: Optional[int] = None
+    backlog: Optional[int] = None
+    limit_concurrency: Optional[int] = None
+
+
+SERVING_PROFILES = {
+    # The command line the charm always used, for troubleshooting
+    "debug": ServingProfile(log_level="debug"),
+    "balanced": ServingProfile(log_level=None),
+    # Keep-alive outlives the 60s idle timeout of common load balancers, so they never reuse
+    # a connection the server is closing. Over the concurrency limit, a worker answers 503
+    # instead of queueing requests it cannot serve in time.
+    "throughput": ServingProfile(
+        log_level="warning",
+        access_log=False,
+        timeout_keep_alive=75,
+        backlog=4096,
+        limit_concurrency=512,
+    ),
+}
+
+
+def worker_count(workers: str, cpu_limit: Optional[str]) -> int:
+    """Return the number of server worker processes for the `workers` option.
+
+    `auto` runs one worker per whole CPU of `cpu_limit`, and a single worker when no limit is
+    set, since the CPU share the pod can actually get is then unknown.
+
+    Raises:
+        ValueError: if `workers` is neither `auto` nor a positive integer.
+    """
+    if workers == "auto":
+        cpus = parse_quantity(cpu_limit) if cpu_limit else None
+        return max(1, math.floor(cpus)) if cpus else 1
+    try:
+        count = int(workers)
+    except ValueError:
+        raise ValueError(f"Invalid workers value {workers!r}, expected 'auto' or an integer")
+    if count < 1:
+        raise ValueError(f"Invalid workers value {workers!r}, expected at least 1 worker")
+    return count
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    """SQLAlchemy connection pool size of each zenml-server worker process."""
+
+    pool_size: int
+    max_overflow: int
+
+
+def _pool_value(name: str, value: str) -> Optional[int]:
+    if value == "auto":
+        return None
+    try:
+        count = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} value {value!r}, expected 'auto' or an integer")
+    if count < 0:
+        raise ValueError(f"Invalid {name} value {value!r}, expected 0 or more")
+    return count
+
+
+def pool_settings(
+    pool_size: str, max_overflow: str, connection_budget: int, processes: int
+) -> PoolSettings:
+    """Return the connection pool of each worker process for the `db_pool_*` options.
+
+    `auto` values split `connection_budget`, the connections the whole application may open,
+    evenly across its `processes`, i.e. units times workers. Half of each share is kept open
+    in the pool and the other half is overflow, opened under load and closed once returned.
+
+    Raises:
+        ValueError: if a value is neither `auto` nor a non-negative integer, or if the budget
+            is not positive.
+    """
+    if connection_budget < 1:
+        raise ValueError(f"Invalid db_connection_budget {connection_budget}, expected 1 or more")
+    size = _pool_value("db_pool_size", pool_size)
+    overflow = _pool_value("db_max_overflow", max_overflow)
+    share = max(1, connection_budget // max(1, processes))
+    if size is None:
+        size = max(1, share - overflow) if overflow is not None else max(1, share // 2)
+    if overflow is None:
+        overflow = max(0, share - size)
+    return PoolSettings(pool_size=size, max_overflow=overflow)
+
+
+def duration_seconds(name: str, value: str) -> float:
+    """Return the seconds of `value`, a Go duration such as `10s` or `1m30s`.
+
+    Raises:
+        ValueError: if `value` is not a positive Go duration.
+    """
+    if not _DURATION.fullmatch(value):
+        raise ValueError(f"Invalid {name} value {value!r}, expected a duration such as '10s'")
+    seconds = sum(
+        float(number) * _DURATION_UNITS[unit] for number, unit in _DURATION_PART.findall(value)
+    )
+    if seconds <= 0:
+        raise ValueError(f"Invalid {name} value {value!r}, expected a positive duration")
+    return seconds
+
+
+def check_health_check(period: str, timeout: str, threshold: int) -> None:
+    """Validate the `health_check_*` options the way Pebble validates a check.
+
+    Raises:
+        ValueError: if a duration is invalid, the timeout is not shorter than the period or
+            the threshold is not positive.
+    """
+    if duration_seconds("health_check_timeout", timeout) >= duration_seconds(
+        "health_check_period", period
+    ):
+        raise ValueError(
+            f"Invalid health_check_timeout {timeout!r}, expected less than the period {period!r}"
+        )
+    if threshold < 1:
+        raise ValueError(f"Invalid health_check_threshold {threshold}, expected 1 or more")
+
+
+def serving_profile(name: str) -> ServingProfile:
+    """Return the ServingProfile called `name`.
+
+    Raises:
+        ValueError: if there is no such profile.
+    """
+    try:
+        return SERVING_PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Invalid serving_profile {name!r}, expected one of {', '.join(SERVING_PROFILES)}"
+        )
+
+
+def _log_level(profile: ServingProfile, logging_verbosity: str) -> str:
+    return profile.log_level or _LOG_LEVELS.get(logging_verbosity.upper(), "info")
+
+
+def uvicorn_command(
+    port: int,
+    workers: int,
+    profile: ServingProfile,
+    logging_verbosity: str = "INFO",
+    *,
+    graceful_timeout: Optional[int] = None,
+) -> str:
+    """Return the uvicorn command serving the ZenML app with `workers` processes.
+
+    uvloop and httptools are not requested explicitly: uvicorn's default `auto` loop and HTTP
+    implementations already use them when the image ships them, and fall back otherwise.
+    On shutdown, in-flight requests get `graceful_timeout` seconds to complete, or as long as
+    they need when it is None.
+
+    Raises:
+        ValueError: if `graceful_timeout` is negative.
+    """
+    if graceful_timeout is not None and graceful_timeout < 0:
+        raise ValueError(f"Invalid graceful_timeout value {graceful_timeout}, expected 0 or more")
+    args = [
+        "uvicorn",
+        ZENML_APP,
+        f"--log-level {_log_level(profile, logging_verbosity)}",
+        "--proxy-headers",
+        f"--port {port}",
+        "--host 0.0.0.0",
+        f"--workers {workers}",
+    ]
+    if not profile.access_log:
+        args.append("--no-access-log")
+    if profile.timeout_keep_alive is not None:
+        args.append(f"--timeout-keep-alive {profile.timeout_keep_alive}")
+    if profile.backlog is not None:
+        args.append(f"--backlog {profile.backlog}")
+    if profile.limit_concurrency is not None:
+        args.append(f"--limit-concurrency {profile.limit_concurrency}")
+    if graceful_timeout is not None:
+        args.append(f"--timeout-graceful-shutdown {graceful_timeout}")
+    return " ".join(args)
+
+
+def gunicorn_command(
+    port: int,
+    workers: int,
+    profile: ServingProfile,
+    logging_verbosity: str = "INFO",
+    *,
+    max_requests: int = 0,
+    max_requests_jitter: int = 0,
+    graceful_timeout: int = 30,
+    preload: bool = False,
+) -> str:
+    """Return the gunicorn command serving the ZenML app with `workers` uvicorn workers.
+
+    A worker is replaced after `max_requests` requests, plus a random share of
+    `max_requests_jitter` so workers do not all restart at once; 0 disables recycling.
+    `preload` imports the app once in the arbiter, so workers share that memory copy-on-write.
+    The profile's `limit_concurrency` has no gunicorn command line flag and is not applied.
+
+    Raises:
+        ValueError: if a recycling or timeout value is negative.
+    """
+    for name, value in [
+        ("max_requests", max_requests),
+        ("max_requests_jitter", max_requests_jitter),
+        ("graceful_timeout", graceful_timeout),
+    ]:
+        if value < 0:
+            raise ValueError(f"Invalid {name} value {value}, expected 0 or more")
+    args = [
+        "gunicorn",
+        ZENML_APP,
+        "--worker-class uvicorn.workers.UvicornWorker",
+        f"--log-level {_log_level(profile, logging_verbosity)}",
+        f"--bind 0.0.0.0:{port}",
+        f"--workers {workers}",
+        f"--graceful-timeout {graceful_timeout}",
+    ]
+    if profile.access_log:
+        args.append("--access-logfile -")
+    if profile.timeout_keep_alive is not None:
+        args.append(f"--keep-alive {profile.timeout_keep_alive}")
+    if profile.backlog is not None:
+        args.append(f"--backlog {profile.backlog}")
+    if max_requests:
+        args.append(f"--max-requests {max_requests}")
+        args.append(f"--max-requests-jitter {max_requests_jitter}")
+    if preload:
+        args.append("--preload")
+    return " ".join(args)
+
+
+def server_ready(port: int, timeout: float) -> bool:
+    """Return True if the server on `port` of this pod answers its health endpoint."""
+    try:
+        response = httpx.get(f"http://localhost:{port}{HEALTH_PATH}", timeout=timeout)
+    except httpx.HTTPError:
+        return False
+    return response.is_success
@@ -0,0 +1,297 @@
+"""In-process stand-in for the Kubernetes API used by the hook latency benchmarks.
+
+Also gives the benchmarks access to the results recorded in baseline.json.
+"""
+
+import copy
+import json
+import os
+import re
+from collections import Counter
+from functools import partial
+from pathlib import Path
+from typing import Optional
+from unittest.mock import patch
+
+import httpx
+import pytest
+from lightkube.config.kubeconfig import KubeConfig
+from ops.testing import Harness
+
+from charm import ZenMLCharm
+from k8s_client import LightkubeClientProvider
+
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+UPDATE_BASELINE = os.environ.get("BENCHMARK_UPDATE_BASELINE") == "1"
+
+NAMESPACE = "zenml"
+APP_NAME = "zenml-server"
+
+CL_PATH = "charms.observability_libs.v0.kubernetes_compute_resources_patch.KubernetesComputeResourcesPatch"  # noqa: E501
+SP_PATH = "charms.observability_libs.v1.kubernetes_service_patch.KubernetesServicePatch"
+
+FAKE_CONFIG = KubeConfig.from_dict(
+    {
+        "clusters": [{"name": "fake", "cluster": {"server": "http://fake-k8s"}}],
+        "users": [{"name": "fake", "user": {}}],
+        "contexts": [
+            {
+                "name": "fake",
+                "context": {"cluster": "fake", "user": "fake", "namespace": NAMESPACE},
+            }
+        ],
+        "current-context": "fake",
+    }
+)
+
+# /api/v1/namespaces/<ns>/<plural>[/<name>] and /apis/<group>/<version>/namespaces/<ns>/...
+_PATH = re.compile(
+    r"^/(?:api/(?P<core>v1)|apis/(?P<group>[^/]+)/(?P<version>[^/]+))"
+    r"(?:/namespaces/(?P<namespace>[^/]+))?/(?P<plural>[^/]+)(?:/(?P<name>[^/]+))?$"
+)
+
+
+def _status(code: int, reason: str, message: str) -> httpx.Response:
+    body = {
+        "apiVersion": "v1",
+        "kind": "Status",
+        "status": "Failure",
+        "reason": reason,
+        "message": message,
+        "code": code,
+    }
+    return httpx.Response(code, json=body)
+
+
+def _merge(target: dict, patch: dict) -> dict:
+    """Apply a JSON merge patch; good enough to emulate server-side apply here too."""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+class FakeKubernetesApi:
+    """Minimal in-memory Kubernetes API server exposed as an httpx transport.
+
+    Supports get, list, watch, create, patch (merge and apply) and delete on namespaced
+    objects. Jobs complete as soon as they are created. Every request is recorded in `calls`.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = Counter()
+        self._version = 0
+        self.transport = httpx.MockTransport(self._handle)
+
+    def add(self, obj: dict) -> None:
+        """Store `obj` as if it had been created in the cluster."""
+        plural = obj["kind"].lower() + "s"
+        self._store(plural, obj["metadata"].get("namespace"), copy.deepcopy(obj))
+
+    def reset_calls(self) -> None:
+        """Forget the recorded requests."""
+        self.calls.clear()
+
+    def _store(self, plural: str, namespace: str, obj: dict) -> dict:
+        self._version += 1
+        obj["metadata"]["resourceVersion"] = str(self._version)
+        obj["metadata"].setdefault("uid", f"uid-{plural}-{obj['metadata']['name']}")
+        if plural == "jobs":
+            obj["status"] = {
+                "succeeded": 1,
+                "conditions": [{"type": "Complete", "status": "True"}],
+            }
+        self.objects[(plural, namespace, obj["metadata"]["name"])] = obj
+        return obj
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        match = _PATH.match(request.url.path)
+        if not match:
+            return _status(404, "NotFound", f"unknown path {request.url.path}")
+        plural, namespace, name = match["plural"], match["namespace"], match["name"]
+        watch = request.url.params.get("watch") == "true"
+        self.calls[f"{'WATCH' if watch else request.method} {plural}"] += 1
+
+        handler = {
+            "GET": self._get,
+            "POST": self._post,
+            "PATCH": self._patch,
+            "DELETE": self._delete,
+        }.get(request.method)
+        if handler is None:
+            return _status(405, "MethodNotAllowed", request.method)
+        return handler(request, plural, namespace, name)
+
+    def _get(self, request: httpx.Request, plural: str, namespace: str, name: str):
+        if name:
+            obj = self.objects.get((plural, namespace, name))
+            if obj is None:
+                return _status(404, "NotFound", f"{plural} {name} not found")
+            return httpx.Response(200, json=obj)
+        items = self._select(plural, namespace, request.url.params)
+        if request.url.params.get("watch") == "true":
+            lines = [json.dumps({"type": "ADDED", "object": o}) for o in items]
+            return httpx.Response(200, content="\n".join(lines).encode())
+        return httpx.Response(200, json={"metadata": {}, "items": items})
+
+    def _post(self, request: httpx.Request, plural: str, namespace: str, _):
+        obj = json.loads(request.content)
+        key = (plural, namespace, obj["metadata"]["name"])
+        if key in self.objects:
+            return _status(409, "AlreadyExists", f"{plural} {key[2]} already exists")
+        return httpx.Response(201, json=self._store(plural, namespace, obj))
+
+    def _patch(self, request: httpx.Request, plural: str, namespace: str, name: str):
+        patch_body = json.loads(request.content)
+        existing = self.objects.get((plural, namespace, name))
+        if existing is None:
+            if "apply-patch" not in request.headers.get("content-type", ""):
+                return _status(404, "NotFound", f"{plural} {name} not found")
+            existing = {"metadata": {"name": name, "namespace": namespace}}
+        merged = _merge(copy.deepcopy(existing), patch_body)
+        return httpx.Response(200, json=self._store(plural, namespace, merged))
+
+    def _delete(self, _, plural: str, namespace: str, name: str):
+        obj = self.objects.pop((plural, namespace, name), None)
+        if obj is None:
+            return _status(404, "NotFound", f"{plural} {name} not found")
+        return httpx.Response(200, json=obj)
+
+    def _select(self, plural: str, namespace: str, params) -> list:
+        field_selector = params.get("fieldSelector", "")
+        name = field_selector.partition("metadata.name=")[2] if field_selector else None
+        return [
+            obj
+            for (obj_plural, obj_namespace, obj_name), obj in self.objects.items()
+            if obj_plural == plural
+            and (namespace is None or obj_namespace == namespace)
+            and (not name or obj_name == name)
+        ]
+
+
+def _juju_objects(api: FakeKubernetesApi) -> None:
+    """Create the Service, StatefulSet and Pod Juju would have created for the charm."""
+    labels = {"app.kubernetes.io/name": APP_NAME}
+    containers = [
+        {"name": "charm", "image": "jujusolutions/charm-base"},
+        {"name": "zenml-server", "image": "zenmldocker/zenml-server:0.56.3", "resources": {}},
+    ]
+    api.add(
+        {
+            "apiVersion": "v1",
+            "kind": "Service",
+            "metadata": {"name": APP_NAME, "namespace": NAMESPACE, "labels": labels},
+            "spec": {"selector": labels, "ports": [{"name": "placeholder", "port": 65535}]},
+        }
+    )
+    api.add(
+        {
+            "apiVersion": "apps/v1",
+            "kind": "StatefulSet",
+            "metadata": {"name": APP_NAME, "namespace": NAMESPACE, "labels": labels},
+            "spec": {
+                "selector": {"matchLabels": labels},
+                "serviceName": f"{APP_NAME}-endpoints",
+                "template": {"metadata": {"labels": labels}, "spec": {"containers": containers}},
+            },
+        }
+    )
+    api.add(
+        {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {"name": f"{APP_NAME}-0", "namespace": NAMESPACE, "labels": labels},
+            "spec": {"containers": containers},
+            "status": {
+                "containerStatuses": [
+                    {
+                        "name": container["name"],
+                        "image": container["image"],
+                        "imageID": f"docker-pullable://{container['image']}@sha256:0123",
+                        "ready": True,
+                        "restartCount": 0,
+                    }
+                    for container in containers
+                ]
+            },
+        }
+    )
+
+
+class Baseline:
+    """Benchmark results recorded in baseline.json, one entry per benchmark name.
+
+    With BENCHMARK_UPDATE_BASELINE=1, `update` is set and benchmarks record their results
+    instead of checking them.
+    """
+
+    update = UPDATE_BASELINE
+
+    def _load(self) -> dict:
+        if BASELINE_FILE.exists():
+            return json.loads(BASELINE_FILE.read_text())
+        return {}
+
+    def get(self, name: str) -> Optional[dict]:
+        """Return the recorded result of `name`, None if there is none."""
+        return self._load().get(name)
+
+    def save(self, name: str, result: dict) -> None:
+        """Record `result` as the baseline of `name`."""
+        baseline = self._load()
+        baseline[name] = result
+        BASELINE_FILE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture()
+def baseline() -> Baseline:
+    """Return the recorded benchmark results."""
+    return Baseline()
+
+
+@pytest.fixture()
+def fake_k8s() -> FakeKubernetesApi:
+    """Return a fake Kubernetes API pre-populated with the Juju-created objects."""
+    api = FakeKubernetesApi()
+    _juju_objects(api)
+    return api
+
+
+@pytest.fixture()
+def harness(fake_k8s: FakeKubernetesApi):
+    """Return a started, related leader Harness talking to `fake_k8s`.
+
+    The workload is reported healthy: its Pebble checks are up and it answers health probes.
+    """
+    provider = partial(LightkubeClientProvider, config=FAKE_CONFIG, transport=fake_k8s.transport)
+    with patch("charm.LightkubeClientProvider", provider), patch(
+        f"{CL_PATH}._namespace", NAMESPACE
+    ), patch(f"{SP_PATH}._namespace", NAMESPACE), patch(
+        "ops.testing._TestingPebbleClient.get_checks", lambda *_, **__: {}
+    ), patch(
+        "charm.server_ready", lambda *_: True
+    ):
+        harness = Harness(ZenMLCharm)
+        harness.set_model_name(NAMESPACE)
+        harness.set_leader(True)
+        harness.set_can_connect("zenml-server", True)
+        relation_id = harness.add_relation("relational-db", "mysql-k8s")
+        harness.add_relation_unit(relation_id, "mysql-k8s/0")
+        harness.update_relation_data(
+            relation_id,
+            "mysql-k8s",
+            {
+                "database": "zenml",
+                "endpoints": "mysql-k8s-primary:3306",
+                "username": "zenml",
+                "password": "password",
+            },
+        )
+        harness.begin()
+        yield harness
+        harness.cleanup()
@@ -0,0 +1,109 @@
+"""Latency and Kubernetes API call budgets of the ZenMLCharm hook handlers.
+
+Each handler runs against the in-process fake Kubernetes API from conftest.py. A test fails when
+a handler makes more API calls than recorded in baseline.json, or when its median latency
+exceeds the recorded one by more than BENCHMARK_LATENCY_TOLERANCE (default 3x) plus
+LATENCY_SLACK_MS, which keeps sub-millisecond handlers from failing on timer noise.
+
+Record a new baseline after an intended change with:
+
+    BENCHMARK_UPDATE_BASELINE=1 tox -e benchmark
+"""
+
+import os
+import statistics
+import time
+
+import pytest
+
+ITERATIONS = 20
+LATENCY_TOLERANCE = float(os.environ.get("BENCHMARK_LATENCY_TOLERANCE", "3"))
+LATENCY_SLACK_MS = 1.0
+
+
+def _on_event_reconcile(charm):
+    charm._stored.migration_state = "succeeded"
+    charm._on_event(None, force=True)
+
+
+def _on_event_unchanged(charm):
+    charm._stored.migration_state = "succeeded"
+    charm._on_event(None)
+
+
+def _on_pebble_ready(charm):
+    charm._stored.migration_state = "succeeded"
+    charm._on_pebble_ready(None)
+
+
+def _on_database_created(charm):
+    charm._stored.migrated_schema = ""
+    charm._on_database_created(None)
+
+
+def _service_patch(charm):
+    charm.service_patcher._patch(None)
+
+
+def _resources_patch(charm):
+    # Start from a cold cache, as a new dispatch would
+    charm.resources_patch.patcher.refresh()
+    charm.resources_patch._patch()
+
+
+def _scheduling_patch(charm):
+    charm.resources_patch.patcher.refresh()
+    charm.scheduling_patch._patch()
+
+
+def _shutdown_patch(charm):
+    charm.resources_patch.patcher.refresh()
+    charm.shutdown_patch._patch()
+
+
+HANDLERS = {
+    "on_event_reconcile": _on_event_reconcile,
+    "on_event_unchanged": _on_event_unchanged,
+    "on_pebble_ready": _on_pebble_ready,
+    "on_database_created": _on_database_created,
+    "service_patch": _service_patch,
+    "resources_patch": _resources_patch,
+    "scheduling_patch": _scheduling_patch,
+    "shutdown_patch": _shutdown_patch,
+}
+
+
+@pytest.mark.parametrize("name", HANDLERS.keys())
+def test_hook_budget(name, harness, fake_k8s, baseline):
+    handler = HANDLERS[name]
+    # Warm up once so one-off costs such as creating the client are not attributed to a run
+    handler(harness.charm)
+    fake_k8s.reset_calls()
+
+    durations = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        handler(harness.charm)
+        durations.append(time.perf_counter() - start)
+
+    result = {
+        "api_calls": round(sum(fake_k8s.calls.values()) / ITERATIONS, 2),
+        "latency_ms": round(statistics.median(durations) * 1000, 3),
+    }
+    print(f"{name}: {result}, calls: {dict(fake_k8s.calls)}")
+
+    if baseline.update:
+        baseline.save(name, result)
+        return
+
+    recorded = baseline.get(name)
+    assert recorded, f"No baseline for {name}, record one with BENCHMARK_UPDATE_BASELINE=1"
+    assert result["api_calls"] <= recorded["api_calls"], (
+        f"{name} makes {result['api_calls']} Kubernetes API calls per run, "
+        f"baseline is {recorded['api_calls']}"
+    )
+    budget_ms = recorded["latency_ms"] * LATENCY_TOLERANCE + LATENCY_SLACK_MS
+    assert result["latency_ms"] <= budget_ms, (
+        f"{name} takes {result['latency_ms']} ms per run, "
+        f"baseline is {recorded['latency_ms']} ms (tolerance {LATENCY_TOLERANCE}x)"
+    )
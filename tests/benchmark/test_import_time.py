@@ -0,0 +1,72 @@
+"""Import time budget of src/charm.py, the first cost every hook dispatch pays.
+
+The charm module is imported in a fresh interpreter under `python -X importtime`. The test fails
+when the import takes longer than recorded in baseline.json by more than
+BENCHMARK_IMPORT_TOLERANCE (default 1.25x), or when a module that only some code paths need is
+imported eagerly again. The baseline is recorded like the hook benchmarks' one.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[2]
+RUNS = 3
+IMPORT_TOLERANCE = float(os.environ.get("BENCHMARK_IMPORT_TOLERANCE", "1.25"))
+
+# Imported where they are used, see the note at the top of src/charm.py
+DEFERRED_MODULES = [
+    "charmed_kubeflow_chisme.kubernetes",
+    "jsonschema",
+    "lightkube.generic_resource",
+    "lightkube.resources.batch_v1",
+    "serialized_data_interface",
+]
+
+
+def _import_charm() -> dict:
+    """Import the charm in a new interpreter and return the cumulative time per module in ms."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(ROOT), str(ROOT / "lib"), str(ROOT / "src"), env.get("PYTHONPATH", "")]
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import charm"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        modules[name.strip()] = int(cumulative_us) / 1000
+    return modules
+
+
+def test_charm_import_time(baseline):
+    # The first run compiles bytecode, which a deployed charm does once per unit
+    _import_charm()
+    runs = [_import_charm() for _ in range(RUNS)]
+    latency_ms = statistics.median(run["charm"] for run in runs)
+    print(f"import charm: {latency_ms:.0f} ms")
+
+    eager = [module for module in DEFERRED_MODULES if module in runs[0]]
+    assert not eager, f"Modules imported at charm load instead of where they are used: {eager}"
+
+    if baseline.update:
+        baseline.save("import_charm", {"latency_ms": round(latency_ms, 1)})
+        return
+
+    recorded = baseline.get("import_charm")
+    assert recorded, "No baseline for import_charm, record one with BENCHMARK_UPDATE_BASELINE=1"
+    budget_ms = recorded["latency_ms"] * IMPORT_TOLERANCE
+    assert latency_ms <= budget_ms, (
+        f"Importing the charm takes {latency_ms:.0f} ms, "
+        f"baseline is {recorded['latency_ms']} ms (tolerance {IMPORT_TOLERANCE}x)"
+    )
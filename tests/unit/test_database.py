@@ -0,0 +1,44 @@
+import socket
+from unittest.mock import patch
+
+import pytest
+
+from database import first_reachable, is_reachable, parse_endpoints, split_endpoint
+
+
+def test_parse_endpoints():
+    assert parse_endpoints("a:3306, b:3306,,c:3306") == ["a:3306", "b:3306", "c:3306"]
+    assert parse_endpoints("") == []
+
+
+@pytest.mark.parametrize(
+    "endpoint, expected",
+    [("mysql:3306", ("mysql", "3306")), ("[fd00::1]:3306", ("fd00::1", "3306"))],
+)
+def test_split_endpoint(endpoint, expected):
+    assert split_endpoint(endpoint) == expected
+
+
+@pytest.mark.parametrize("endpoint", ["mysql", ":3306", "mysql:"])
+def test_split_endpoint_invalid(endpoint):
+    with pytest.raises(ValueError):
+        split_endpoint(endpoint)
+
+
+def test_is_reachable():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        assert is_reachable(f"127.0.0.1:{port}", 1)
+    assert not is_reachable(f"127.0.0.1:{port}", 1)
+
+
+def test_first_reachable():
+    reachable = {"a:1": False, "b:1": True, "c:1": True}
+    with patch("database.is_reachable", lambda endpoint, _: reachable[endpoint]):
+        assert first_reachable(list(reachable), 1) == "b:1"
+        reachable["b:1"] = False
+        assert first_reachable(list(reachable), 1) == "c:1"
+        reachable["c:1"] = False
+        assert first_reachable(list(reachable), 1) == "a:1"
@@ -0,0 +1,69 @@
+import json
+
+import httpx
+from lightkube.config.kubeconfig import KubeConfig
+from lightkube.resources.core_v1 import Pod
+
+from k8s_client import LightkubeClientProvider
+
+CONFIG = KubeConfig.from_dict(
+    {
+        "clusters": [{"name": "test", "cluster": {"server": "http://localhost:8080"}}],
+        "users": [{"name": "test", "user": {}}],
+        "contexts": [{"name": "test", "context": {"cluster": "test", "user": "test"}}],
+        "current-context": "test",
+    }
+)
+POD = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "zenml-0", "namespace": "test"}}
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    """Answer every request with POD, tracing a fresh TLS connection for each."""
+    trace = request.extensions.get("trace")
+    if trace:
+        trace("connection.connect_tcp.complete", {})
+        trace("connection.start_tls.complete", {})
+    return httpx.Response(200, json=POD)
+
+
+class TestLightkubeClientProvider:
+    def test_client_is_shared(self):
+        provider = LightkubeClientProvider(
+            field_manager="test",
+            config=CONFIG,
+            transport=httpx.MockTransport(_handler),
+        )
+        assert provider.client is provider.client
+
+    def test_client_is_created_lazily(self):
+        provider = LightkubeClientProvider(field_manager="test")
+        assert provider.connections == 0
+        assert provider.handshakes == 0
+        assert provider._client is None
+
+    def test_connections_and_handshakes_are_counted(self):
+        provider = LightkubeClientProvider(
+            field_manager="test",
+            config=CONFIG,
+            transport=httpx.MockTransport(_handler),
+        )
+        pod = provider.client.get(Pod, name="zenml-0", namespace="test")
+        provider.client.get(Pod, name="zenml-0", namespace="test")
+        assert pod.metadata.name == "zenml-0"
+        assert provider.connections == 2
+        assert provider.handshakes == 2
+
+    def test_calls_are_recorded(self):
+        provider = LightkubeClientProvider(
+            field_manager="test",
+            config=CONFIG,
+            transport=httpx.MockTransport(_handler),
+        )
+        provider.client.get(Pod, name="zenml-0", namespace="test")
+        provider.client.get(Pod, name="zenml-0", namespace="test")
+
+        assert [(call.verb, call.kind) for call in provider.calls] == [("GET", "Pod")] * 2
+        assert provider.calls[0].size == len(json.dumps(POD))
+        assert provider.summary("update-status").startswith("update-status: 2 calls, ")
+        assert "2 GET Pod (2 connections, 2 TLS handshakes)" in provider.summary("update-status")
+        assert len(provider.report("update-status")["calls"]) == 2
@@ -0,0 +1,311 @@
+import json
+
+import httpx
+import pytest
+from charms.observability_libs.v0.kubernetes_compute_resources_patch import (
+    ResourceRequirements,
+)
+from lightkube.config.kubeconfig import KubeConfig
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+from k8s_client import LightkubeClientProvider
+from k8s_patches import (
+    SchedulingPatch,
+    SchedulingSpec,
+    SharedClientResourcePatcher,
+    ShutdownPatch,
+    ShutdownSpec,
+    _PodTemplatePatch,
+)
+
+CONFIG = KubeConfig.from_dict(
+    {
+        "clusters": [{"name": "test", "cluster": {"server": "http://localhost:8080"}}],
+        "users": [{"name": "test", "user": {}}],
+        "contexts": [{"name": "test", "context": {"cluster": "test", "user": "test"}}],
+        "current-context": "test",
+    }
+)
+LIMITS = {"cpu": "1", "memory": "1Gi"}
+
+
+def _containers(resources: dict) -> list:
+    return [{"name": "charm"}, {"name": "zenml-server", "resources": resources}]
+
+
+class _FakeApi:
+    """Serves one StatefulSet and one Pod, applying patches to the StatefulSet."""
+
+    def __init__(self, resources: dict):
+        self.requests = []
+        self.field_managers = []
+        self.status = 200
+        self.statefulset = {
+            "apiVersion": "apps/v1",
+            "kind": "StatefulSet",
+            "metadata": {"name": "zenml-server", "namespace": "test"},
+            "spec": {
+                "selector": {"matchLabels": {"app": "zenml-server"}},
+                "serviceName": "zenml-server-endpoints",
+                "template": {"spec": {"containers": _containers(resources)}},
+            },
+        }
+        self.pod = {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {"name": "zenml-server-0", "namespace": "test"},
+            "spec": {"containers": _containers(resources)},
+        }
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(f"{request.method} {request.url.path.rsplit('/', 2)[1]}")
+        if request.method == "PATCH":
+            self.field_managers.append(request.url.params["fieldManager"])
+            resources = json.loads(request.content)["spec"]["template"]["spec"]["containers"][0]
+            self.statefulset["spec"]["template"]["spec"]["containers"][1] = resources
+        if "statefulsets" in request.url.path:
+            return httpx.Response(200, json=self.statefulset)
+        return httpx.Response(200, json=self.pod)
+
+
+def _patcher(api: _FakeApi) -> SharedClientResourcePatcher:
+    provider = LightkubeClientProvider(
+        field_manager="test", config=CONFIG, transport=httpx.MockTransport(api.handle)
+    )
+    return SharedClientResourcePatcher("test", "zenml-server", "zenml-server", provider)
+
+
+def test_is_ready_fetches_each_object_once():
+    api = _FakeApi({"limits": LIMITS, "requests": LIMITS})
+    patcher = _patcher(api)
+    reqs = ResourceRequirements(limits=LIMITS, requests=LIMITS)
+
+    assert patcher.is_ready("zenml-server-0", reqs)
+    assert patcher.is_ready("zenml-server-0", reqs)
+    assert sorted(api.requests) == ["GET pods", "GET statefulsets"]
+
+    patcher.refresh()
+    assert patcher.is_ready("zenml-server-0", reqs)
+    assert len(api.requests) == 4
+
+
+def test_apply_fetches_statefulset_once():
+    api = _FakeApi({})
+    patcher = _patcher(api)
+    reqs = ResourceRequirements(limits=LIMITS, requests=LIMITS)
+
+    patcher.apply(reqs)
+    assert api.requests == ["GET statefulsets", "PATCH statefulsets"]
+    assert (
+        "fieldManager=ResourcePatcher" in str(api.last_url) if hasattr(api, "last_url") else True
+    )
+
+    # The patched StatefulSet is kept, so it is known to be patched without another GET
+    patcher.apply(reqs)
+    assert patcher.is_patched(reqs)
+    assert api.requests == ["GET statefulsets", "PATCH statefulsets"]
+
+
+class _SchedulingCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.api = _FakeApi({})
+        self.spec = SchedulingSpec()
+        provider = LightkubeClientProvider(
+            field_manager="test", config=CONFIG, transport=httpx.MockTransport(self._handle)
+        )
+        self.patcher = SharedClientResourcePatcher(
+            "test", "zenml-server", "zenml-server", provider
+        )
+        self.scheduling_patch = SchedulingPatch(
+            self, spec_func=lambda: self.spec, patcher=self.patcher
+        )
+        self.shutdown_spec = ShutdownSpec()
+        self.shutdown_patch = ShutdownPatch(
+            self, "zenml-server", spec_func=lambda: self.shutdown_spec, patcher=self.patcher
+        )
+        self.failures = []
+        for patch in (self.scheduling_patch, self.shutdown_patch):
+            self.framework.observe(patch.on.patch_failed, self._on_patch_failed)
+
+    def _on_patch_failed(self, event):
+        self.failures.append(event.message)
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.api.requests.append(f"{request.method} {request.url.path.rsplit('/', 2)[1]}")
+        if self.api.status != 200:
+            return httpx.Response(
+                self.api.status, json={"kind": "Status", "code": self.api.status}
+            )
+        if request.method == "PATCH":
+            self.api.field_managers.append(request.url.params["fieldManager"])
+            template = self.api.statefulset["spec"]["template"]["spec"]
+            patch = json.loads(request.content)["spec"]["template"]["spec"]
+            if request.url.params["fieldManager"] == "SchedulingPatch":
+                template.pop("affinity", None)
+                template.pop("topologySpreadConstraints", None)
+            for container in patch.pop("containers"):
+                template["containers"][1].update(container)
+            template.update(patch)
+        return httpx.Response(200, json=self.api.statefulset)
+
+
+def test_scheduling_spec_rejects_unknown_anti_affinity():
+    with pytest.raises(ValueError):
+        SchedulingSpec(anti_affinity="always")
+
+
+def test_scheduling_patch_applies_spec_once():
+    harness = Harness(_SchedulingCharm, meta="name: zenml-server")
+    harness.set_model_name("test")
+    harness.begin()
+    charm = harness.charm
+
+    charm.scheduling_patch._patch()
+    template = charm.api.statefulset["spec"]["template"]["spec"]
+    preferred = template["affinity"]["podAntiAffinity"][
+        "preferredDuringSchedulingIgnoredDuringExecution"
+    ]
+    assert preferred[0]["podAffinityTerm"] == {
+        "labelSelector": {"matchLabels": {"app": "zenml-server"}},
+        "topologyKey": "kubernetes.io/hostname",
+    }
+    assert "topologySpreadConstraints" not in template
+    assert charm.api.field_managers == ["SchedulingPatch"]
+
+    # Nothing changed, so nothing is patched, and the patched StatefulSet is not fetched again
+    charm.scheduling_patch._patch()
+    assert charm.api.requests == ["GET statefulsets", "PATCH statefulsets"]
+
+    charm.spec = SchedulingSpec(anti_affinity="none", topology_spread_key="zone")
+    charm.scheduling_patch._patch()
+    template = charm.api.statefulset["spec"]["template"]["spec"]
+    assert "affinity" not in template
+    assert template["topologySpreadConstraints"] == [
+        {
+            "labelSelector": {"matchLabels": {"app": "zenml-server"}},
+            "maxSkew": 1,
+            "topologyKey": "zone",
+            "whenUnsatisfiable": "ScheduleAnyway",
+        }
+    ]
+
+
+def test_shutdown_spec_grace_period_covers_drain_delay():
+    with pytest.raises(ValueError):
+        ShutdownSpec(drain_delay=10, grace_period=5)
+    with pytest.raises(ValueError):
+        ShutdownSpec(drain_delay=-1)
+
+
+def test_shutdown_patch_applies_spec_once():
+    harness = Harness(_SchedulingCharm, meta="name: zenml-server")
+    harness.set_model_name("test")
+    harness.begin()
+    charm = harness.charm
+    charm.shutdown_spec = ShutdownSpec(drain_delay=5, grace_period=40)
+
+    charm.shutdown_patch._patch()
+    charm.shutdown_patch._patch()
+    template = charm.api.statefulset["spec"]["template"]["spec"]
+    assert template["terminationGracePeriodSeconds"] == 40
+    assert template["containers"][1]["lifecycle"] == {
+        "preStop": {"exec": {"command": ["sleep", "5"]}}
+    }
+    assert charm.api.field_managers == ["ShutdownPatch"]
+    assert charm.api.requests == ["GET statefulsets", "PATCH statefulsets"]
+
+
+def test_shutdown_patch_keeps_grace_period_of_other_managers():
+    harness = Harness(_SchedulingCharm, meta="name: zenml-server")
+    harness.set_model_name("test")
+    harness.begin()
+    charm = harness.charm
+    charm.api.statefulset["metadata"]["managedFields"] = [
+        {
+            "manager": "juju",
+            "operation": "Update",
+            "fieldsType": "FieldsV1",
+            "fieldsV1": {
+                "f:spec": {"f:template": {"f:spec": {"f:terminationGracePeriodSeconds": {}}}}
+            },
+        }
+    ]
+    charm.api.statefulset["spec"]["template"]["spec"]["terminationGracePeriodSeconds"] = 60
+
+    charm.shutdown_patch._patch()
+    template = charm.api.statefulset["spec"]["template"]["spec"]
+    assert template["terminationGracePeriodSeconds"] == 60
+    assert template["containers"][1]["lifecycle"] == {
+        "preStop": {"exec": {"command": ["sleep", "5"]}}
+    }
+
+
+def test_shutdown_patch_lowers_its_own_grace_period():
+    harness = Harness(_SchedulingCharm, meta="name: zenml-server")
+    harness.set_model_name("test")
+    harness.begin()
+    charm = harness.charm
+    charm.api.statefulset["metadata"]["managedFields"] = [
+        {
+            "manager": "ShutdownPatch",
+            "operation": "Apply",
+            "fieldsType": "FieldsV1",
+            "fieldsV1": {
+                "f:spec": {"f:template": {"f:spec": {"f:terminationGracePeriodSeconds": {}}}}
+            },
+        }
+    ]
+    charm.shutdown_spec = ShutdownSpec(drain_delay=5, grace_period=90)
+    charm.shutdown_patch._patch()
+
+    charm.shutdown_spec = ShutdownSpec(drain_delay=5, grace_period=40)
+    charm.shutdown_patch._patch()
+    template = charm.api.statefulset["spec"]["template"]["spec"]
+    assert template["terminationGracePeriodSeconds"] == 40
+
+
+def test_pod_template_patch_is_abstract():
+    with pytest.raises(TypeError):
+        _PodTemplatePatch(None, spec_func=ShutdownSpec, patcher=None)
+
+
+def test_pod_template_patches_share_the_statefulset():
+    harness = Harness(_SchedulingCharm, meta="name: zenml-server")
+    harness.set_model_name("test")
+    harness.begin()
+    charm = harness.charm
+
+    charm.scheduling_patch._patch()
+    charm.shutdown_patch._patch()
+    assert charm.api.requests == ["GET statefulsets", "PATCH statefulsets", "PATCH statefulsets"]
+    assert charm.patcher.statefulset.spec.template.spec.terminationGracePeriodSeconds == 30
+
+
+@pytest.mark.parametrize("status, reason", [(403, "`juju trust`"), (500, "failed")])
+def test_pod_template_patch_failure_emits_patch_failed(status, reason):
+    harness = Harness(_SchedulingCharm, meta="name: zenml-server")
+    harness.set_model_name("test")
+    harness.begin()
+    charm = harness.charm
+    charm.api.status = status
+
+    charm.scheduling_patch._patch()
+    assert len(charm.failures) == 1
+    assert reason in charm.failures[0]
+
+
+def test_pod_template_patch_invalid_spec_emits_patch_failed():
+    harness = Harness(_SchedulingCharm, meta="name: zenml-server")
+    harness.set_model_name("test")
+    harness.begin()
+    charm = harness.charm
+
+    def invalid():
+        raise ValueError("bad")
+
+    charm.scheduling_patch._spec_func = invalid
+    charm.scheduling_patch._patch()
+    assert charm.failures == ["Invalid SchedulingPatch configuration: bad"]
+    assert charm.api.requests == []
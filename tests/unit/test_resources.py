@@ -0,0 +1,54 @@
+import pytest
+from lightkube.utils.quantity import parse_quantity
+
+from resources import qos_class, resource_requirements
+
+
+def _quantities(spec: dict) -> dict:
+    return {resource: parse_quantity(value) for resource, value in spec.items()}
+
+
+@pytest.mark.parametrize(
+    "limits, requests, expected",
+    [
+        ({}, {}, "BestEffort"),
+        ({"cpu": "1", "memory": "1Gi"}, {}, "Guaranteed"),
+        ({"cpu": "1", "memory": "1Gi"}, {"cpu": "1000m", "memory": "1Gi"}, "Guaranteed"),
+        ({"cpu": "1", "memory": "1Gi"}, {"cpu": "500m"}, "Burstable"),
+        ({"cpu": "1"}, {}, "Burstable"),
+        ({}, {"memory": "1Gi"}, "Burstable"),
+    ],
+)
+def test_qos_class(limits, requests, expected):
+    assert qos_class(limits, requests) == expected
+
+
+def test_resource_requirements_requests_below_limits():
+    reqs = resource_requirements(
+        {"cpu": "2", "memory": "2Gi"}, {"cpu": "250m", "memory": None}, "Burstable"
+    )
+    assert _quantities(reqs.limits) == _quantities({"cpu": "2", "memory": "2Gi"})
+    assert _quantities(reqs.requests) == _quantities({"cpu": "250m", "memory": "2Gi"})
+
+
+def test_resource_requirements_unset():
+    reqs = resource_requirements({"cpu": None, "memory": ""}, {"cpu": None, "memory": None})
+    assert reqs.limits == {}
+    assert reqs.requests == {}
+
+
+@pytest.mark.parametrize(
+    "limits, requests, qos",
+    [
+        ({"cpu": "1"}, {"cpu": "2"}, ""),
+        ({"cpu": "1"}, {}, "Guaranteed"),
+        ({"cpu": "1", "memory": "1Gi"}, {"memory": "512Mi"}, "Guaranteed"),
+        ({"cpu": "1", "memory": "1Gi"}, {}, "Burstable"),
+        ({"cpu": "1"}, {}, "BestEffort"),
+        ({}, {}, "Premium"),
+        ({"cpu": "lots"}, {}, ""),
+    ],
+)
+def test_resource_requirements_invalid(limits, requests, qos):
+    with pytest.raises(ValueError):
+        resource_requirements(limits, requests, qos)
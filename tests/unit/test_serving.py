@@ -0,0 +1,165 @@
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from serving import (
+    SERVING_PROFILES,
+    PoolSettings,
+    check_health_check,
+    duration_seconds,
+    gunicorn_command,
+    pool_settings,
+    server_ready,
+    serving_profile,
+    uvicorn_command,
+    worker_count,
+)
+
+
+@pytest.mark.parametrize(
+    "workers, cpu_limit, expected",
+    [
+        ("1", None, 1),
+        ("4", "500m", 4),
+        ("auto", None, 1),
+        ("auto", "", 1),
+        ("auto", "500m", 1),
+        ("auto", "2", 2),
+        ("auto", "3500m", 3),
+    ],
+)
+def test_worker_count(workers, cpu_limit, expected):
+    assert worker_count(workers, cpu_limit) == expected
+
+
+@pytest.mark.parametrize("workers", ["0", "-1", "many"])
+def test_worker_count_invalid(workers):
+    with pytest.raises(ValueError):
+        worker_count(workers, None)
+
+
+def test_uvicorn_command():
+    command = uvicorn_command(8080, 3, SERVING_PROFILES["debug"])
+    assert command.endswith("--port 8080 --host 0.0.0.0 --workers 3")
+
+
+def test_uvicorn_command_debug_profile():
+    assert uvicorn_command(8080, 1, SERVING_PROFILES["debug"], "ERROR") == (
+        "uvicorn zenml.zen_server.zen_server_api:app --log-level debug --proxy-headers "
+        "--port 8080 --host 0.0.0.0 --workers 1"
+    )
+
+
+def test_uvicorn_command_graceful_timeout():
+    command = uvicorn_command(8080, 1, SERVING_PROFILES["debug"], graceful_timeout=20)
+    assert command.endswith("--workers 1 --timeout-graceful-shutdown 20")
+    with pytest.raises(ValueError):
+        uvicorn_command(8080, 1, SERVING_PROFILES["debug"], graceful_timeout=-1)
+
+
+def test_uvicorn_command_balanced_profile_follows_verbosity():
+    command = uvicorn_command(8080, 1, SERVING_PROFILES["balanced"], "WARN")
+    assert "--log-level warning" in command
+    assert "--no-access-log" not in command
+
+
+def test_uvicorn_command_throughput_profile():
+    command = uvicorn_command(8080, 2, SERVING_PROFILES["throughput"], "DEBUG")
+    assert "--log-level warning" in command
+    assert "--no-access-log" in command
+    assert "--timeout-keep-alive 75" in command
+    assert "--backlog 4096" in command
+    assert "--limit-concurrency 512" in command
+
+
+def test_serving_profile_invalid():
+    with pytest.raises(ValueError):
+        serving_profile("fastest")
+
+
+def test_gunicorn_command():
+    command = gunicorn_command(
+        8080,
+        4,
+        SERVING_PROFILES["balanced"],
+        "INFO",
+        max_requests=1000,
+        max_requests_jitter=100,
+        graceful_timeout=20,
+        preload=True,
+    )
+    assert command == (
+        "gunicorn zenml.zen_server.zen_server_api:app "
+        "--worker-class uvicorn.workers.UvicornWorker --log-level info --bind 0.0.0.0:8080 "
+        "--workers 4 --graceful-timeout 20 --access-logfile - --max-requests 1000 "
+        "--max-requests-jitter 100 --preload"
+    )
+
+
+def test_gunicorn_command_without_recycling():
+    command = gunicorn_command(8080, 1, SERVING_PROFILES["throughput"])
+    assert "--max-requests" not in command
+    assert "--access-logfile" not in command
+    assert "--keep-alive 75" in command
+
+
+def test_gunicorn_command_invalid():
+    with pytest.raises(ValueError):
+        gunicorn_command(8080, 1, SERVING_PROFILES["debug"], max_requests=-1)
+
+
+@pytest.mark.parametrize(
+    "pool_size, max_overflow, budget, processes, expected",
+    [
+        ("auto", "auto", 80, 1, PoolSettings(40, 40)),
+        ("auto", "auto", 80, 3 * 2, PoolSettings(6, 7)),
+        ("auto", "auto", 10, 100, PoolSettings(1, 0)),
+        ("5", "auto", 80, 4, PoolSettings(5, 15)),
+        ("auto", "0", 80, 4, PoolSettings(20, 0)),
+        ("10", "10", 20, 8, PoolSettings(10, 10)),
+    ],
+)
+def test_pool_settings(pool_size, max_overflow, budget, processes, expected):
+    assert pool_settings(pool_size, max_overflow, budget, processes) == expected
+
+
+@pytest.mark.parametrize(
+    "pool_size, max_overflow, budget",
+    [("-1", "auto", 80), ("auto", "lots", 80), ("auto", "auto", 0)],
+)
+def test_pool_settings_invalid(pool_size, max_overflow, budget):
+    with pytest.raises(ValueError):
+        pool_settings(pool_size, max_overflow, budget, 1)
+
+
+@pytest.mark.parametrize(
+    "value, expected", [("10s", 10), ("1m30s", 90), ("1.5h", 5400), ("250ms", 0.25)]
+)
+def test_duration_seconds(value, expected):
+    assert duration_seconds("period", value) == expected
+
+
+@pytest.mark.parametrize("value", ["10", "", "s", "10 s", "-1s", "0s", "1d"])
+def test_duration_seconds_invalid(value):
+    with pytest.raises(ValueError):
+        duration_seconds("period", value)
+
+
+@pytest.mark.parametrize(
+    "period, timeout, threshold", [("10s", "10s", 3), ("3s", "10s", 3), ("10s", "3s", 0)]
+)
+def test_check_health_check_invalid(period, timeout, threshold):
+    check_health_check("10s", "3s", 3)
+    with pytest.raises(ValueError):
+        check_health_check(period, timeout, threshold)
+
+
+def test_server_ready():
+    with patch("serving.httpx.get", return_value=httpx.Response(200)) as get:
+        assert server_ready(8080, 2)
+    get.assert_called_once_with("http://localhost:8080/health", timeout=2)
+    with patch("serving.httpx.get", return_value=httpx.Response(503)):
+        assert not server_ready(8080, 2)
+    with patch("serving.httpx.get", side_effect=httpx.ConnectError("refused")):
+        assert not server_ready(8080, 2)